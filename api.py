@@ -0,0 +1,295 @@
+import csv
+import json
+import os
+import time
+import urllib.parse
+import urllib.request
+from contextlib import contextmanager
+from http.cookies import SimpleCookie
+from urllib.error import HTTPError, URLError
+import metrics
+from campaigns import CampaignError
+
+
+class ABClient:
+    """Minimal Action Builder GraphQL client that reuses a saved browser session."""
+
+    UPLOAD_STATUS_QUERY = """
+query UploadStatusQuery($name: String!) {
+  uploads(name: $name) {
+    name
+    status
+  }
+}"""
+    LOGIN_MUTATION = """
+mutation LoginMutation($email: String!, $password: String!) {
+  login(email: $email, password: $password) {
+    token
+  }
+}"""
+    CAMPAIGNS_QUERY = """
+query CampaignsQuery($name: String!) {
+  campaigns(name: $name) {
+    id
+    name
+  }
+}"""
+    CREATE_UPLOAD_MUTATION = """
+mutation CreateUploadMutation($input: CreateUploadInput!) {
+  createUpload(input: $input) {
+    upload {
+      name
+      status
+    }
+  }
+}"""
+    # GraphQL enum values -> the labels shown on /admin/upload/list
+    STATUS_LABELS = {
+        'COMPLETE': 'Complete',
+        'FAILURE': 'Failure',
+        'PROCESSING': 'Processing',
+        'PENDING': 'Pending',
+    }
+
+    def __init__(self, base_url, session, timeout=20):
+        self.base_url = base_url
+        self.timeout = timeout
+        self.headers = {
+            'Content-Type': 'application/json',
+            'Cookie': '; '.join('%s=%s' % (c['name'], c['value']) for c in session['cookies']),
+        }
+        token = session.get('local_storage', {}).get('token')
+        if token:
+            self.headers['Authorization'] = 'Bearer %s' % token
+
+    @classmethod
+    def login(cls, base_url, email, password, timeout=20):
+        """Log in over HTTP and return a session in the shape ABUploader saves."""
+        client = cls(base_url, {"cookies": []}, timeout)
+        data, response = client.graphql('LoginMutation', cls.LOGIN_MUTATION, {
+            "email": email,
+            "password": password,
+        }, with_response=True)
+        cookies = SimpleCookie()
+        for header in response.headers.get_all('Set-Cookie') or []:
+            cookies.load(header)
+        with expect_shape('LoginMutation'):
+            token = data['login'].get('token')
+        return {
+            "cookies": [{"name": k, "value": v.value} for k, v in cookies.items()],
+            "local_storage": {"token": token} if token else {},
+        }
+
+    def request(self, operation, path, data, headers):
+        request = urllib.request.Request(self.base_url + path, data=data, headers={**self.headers, **headers})
+        try:
+            response = urllib.request.urlopen(request, timeout=self.timeout)
+            result = json.loads(response.read())
+        except HTTPError as e:
+            if e.code in (401, 403):
+                raise SessionError('Session rejected (%d)' % e.code)
+            raise APIError('%s failed: HTTP %d' % (operation, e.code))
+        except URLError as e:
+            raise APIError('%s failed: %s' % (operation, e.reason))
+        except OSError as e:
+            # Read timeouts and dropped connections, which urllib doesn't wrap in URLError
+            raise APIError('%s failed: %s' % (operation, e))
+        except ValueError:
+            # e.g. an HTML page, if the path falls through to the app
+            raise APIError('%s failed: response is not JSON' % operation)
+        if not isinstance(result, dict):
+            raise APIError('%s failed: unexpected response' % operation)
+        return result, response
+
+    def graphql(self, operation, query, variables, with_response=False):
+        result, response = self.request(operation, '/graphql', json.dumps({
+            "operationName": operation,
+            "query": query,
+            "variables": variables,
+        }).encode('utf-8'), {})
+        if result.get('errors'):
+            with expect_shape(operation):
+                messages = [str(e.get('message', '')) for e in result['errors']]
+            if any('auth' in m.lower() for m in messages):
+                raise SessionError('\n'.join(messages))
+            raise APIError('\n'.join(messages))
+        if not isinstance(result.get('data'), dict):
+            raise APIError('%s failed: response has no data' % operation)
+        return (result['data'], response) if with_response else result['data']
+
+    def upload_file(self, file_path):
+        """Send a CSV the way the wizard's file input does. Returns the stored file's id."""
+        file_name = os.path.basename(file_path)
+        with open(file_path, 'rb') as file:
+            result, response = self.request('UploadFile', '/upload/file?name=%s' % urllib.parse.quote(file_name),
+                                            file.read(), {'Content-Type': 'text/csv'})
+        with expect_shape('UploadFile'):
+            return result['fileId']
+
+    def get_campaign_id(self, campaign_name):
+        data = self.graphql('CampaignsQuery', self.CAMPAIGNS_QUERY, {"name": campaign_name})
+        with expect_shape('CampaignsQuery'):
+            return next((c['id'] for c in data['campaigns'] if c['name'] == campaign_name), None)
+
+    def create_upload(self, upload_input):
+        data = self.graphql('CreateUploadMutation', self.CREATE_UPLOAD_MUTATION, {"input": upload_input})
+        with expect_shape('CreateUploadMutation'):
+            return data['createUpload']['upload']['name']
+
+    def get_upload_status(self, upload_name):
+        data = self.graphql('UploadStatusQuery', self.UPLOAD_STATUS_QUERY, {"name": upload_name})
+        with expect_shape('UploadStatusQuery'):
+            upload = next((u for u in data['uploads'] if u['name'] == upload_name), None)
+            if upload is None:
+                raise APIError('Upload %s not found' % upload_name)
+            return self.STATUS_LABELS.get(upload['status'], upload['status'].title())
+
+
+class APIUploader:
+    """Starts uploads by sending the requests the upload wizard would, without a browser."""
+
+    SESSION_TTL = int(os.getenv('SESSION_TTL', 8 * 60 * 60))
+    # Sub-columns of info fields, in the order the wizard's dialogs list them
+    INFO_COLUMNS = {
+        'notes': ['note_col'],
+        'address': ['street_col', 'city_col', 'state_col', 'zip_col', 'lat_col', 'lon_col'],
+    }
+
+    def __init__(self, config, upload_file=None, upload_name=None, session_store=None, checkpoint=None):
+        self.UPLOAD_FILE = upload_file
+        self.UPLOAD_NAME = upload_name
+        self.CAMPAIGN_NAME = config['campaign_name']
+        self.FIELD_MAP = config['field_map']
+        self.INSTANCE = config['instance']
+        self.BASE_URL = config.get('base_url') or 'https://%s.actionbuilder.org' % config['instance']
+        self.session_store = session_store
+        self.checkpoint = checkpoint or (lambda stage, **fields: None)
+        self._client = None
+
+
+    @property
+    def client(self):
+        if self._client is None:
+            session = self.session_store.get(self.INSTANCE) if self.session_store else None
+            if not session:
+                session = ABClient.login(self.BASE_URL, os.getenv('AB_LOGIN'), os.getenv('AB_PASSWORD'))
+                print("Logged in succesfully")
+                if self.session_store:
+                    self.session_store.put(self.INSTANCE, session, ttl=self.SESSION_TTL)
+            self._client = ABClient(self.BASE_URL, session)
+        return self._client
+
+
+    def start_upload(self, upload_type):
+        try:
+            return self.send_upload(upload_type)
+        except SessionError:
+            # Saved session expired server side, so log in again once
+            print("Saved session rejected")
+            if self.session_store:
+                self.session_store.delete(self.INSTANCE)
+            self._client = None
+            return self.send_upload(upload_type)
+
+
+    def send_upload(self, upload_type):
+        print("Starting %s upload: %s" % (upload_type, self.CAMPAIGN_NAME))
+        campaign_id = self.client.get_campaign_id(self.CAMPAIGN_NAME)
+        if campaign_id is None:
+            raise CampaignError('Campaign %s not found' % self.CAMPAIGN_NAME)
+        with open(self.UPLOAD_FILE, newline='') as file:
+            columns = next(csv.reader(file))
+        with metrics.span('api.send_file'):
+            file_id = self.client.upload_file(self.UPLOAD_FILE)
+        self.checkpoint('file sent')
+        mapping = self.build_mapping(upload_type, columns)
+        print("Mapping %s fields: %s" % (upload_type, self.CAMPAIGN_NAME))
+        for m in mapping:
+            print('Mapped %s to %s' % (m['column'], m['field']))
+        # Recorded before sending, so a retry can look the upload up if the response never arrives
+        upload_name = '%s %s %s' % (os.path.basename(self.UPLOAD_FILE), upload_type, time.strftime('%Y-%m-%d %H:%M:%S'))
+        self.checkpoint('mapped', upload_name=upload_name)
+        with metrics.span('api.create_upload'):
+            self.UPLOAD_NAME = self.client.create_upload({
+                "name": upload_name,
+                "campaignId": campaign_id,
+                "fileId": file_id,
+                "uploadType": 'entities' if 'people' in upload_type else 'fields',
+                "entityType": 'People',
+                "idMatch": {
+                    "idType": self.FIELD_MAP['id']['ab_type'],
+                    "column": self.FIELD_MAP['id']['column'],
+                },
+                "mapping": mapping,
+                "createResponses": 'info' in upload_type,
+            })
+        self.checkpoint('submitted', upload_name=self.UPLOAD_NAME)
+        print('---Upload confirmed for %s: %s---' % (upload_type, self.CAMPAIGN_NAME))
+        return self.UPLOAD_NAME
+
+
+    def build_mapping(self, upload_type, columns):
+        field_map = self.FIELD_MAP[upload_type]
+        mapping = []
+        for column in columns:
+            if 'people' in upload_type and field_map.get(column):
+                map_to = field_map[column]
+                entry = {"column": column, "field": map_to}
+                if map_to == 'Email':
+                    entry['type'] = field_map.get('email_type')
+                if map_to == 'Phone Number':
+                    entry['type'] = field_map.get('phone_type')
+                mapping.append(entry)
+            if 'info' in upload_type and column in field_map:
+                field_info = field_map[column]
+                entry = {
+                    "column": column,
+                    "field": field_info['name'],
+                    "section": field_info.get('section'),
+                    "type": field_info['type'],
+                }
+                sub_columns = self.INFO_COLUMNS.get(field_info['type'], [])
+                if sub_columns:
+                    entry['subColumns'] = {k[:-len('_col')]: field_info.get(k) for k in sub_columns}
+                mapping.append(entry)
+        return mapping
+
+
+    def find_upload(self, file_name, upload_name=None, since=None):
+        """upload_name if Action Builder has it. The API can't list uploads, so without a name it's None."""
+        if not upload_name:
+            return None
+        try:
+            self.client.get_upload_status(upload_name)
+        except SessionError:
+            raise
+        except APIError:
+            return None
+        return upload_name
+
+
+    def get_upload_status(self):
+        with metrics.span('status_check', source='api'):
+            status = self.client.get_upload_status(self.UPLOAD_NAME)
+        print("Upload is %s — %s" % (status, self.CAMPAIGN_NAME))
+        return status
+
+
+    def quit(self):
+        pass
+
+
+@contextmanager
+def expect_shape(operation):
+    """Report a response missing the fields we read as an APIError, so callers can fall back."""
+    try:
+        yield
+    except (KeyError, TypeError, AttributeError) as e:
+        raise APIError('%s failed: unexpected response (%s)' % (operation, e))
+
+
+class APIError(Exception):
+    pass
+
+class SessionError(APIError):
+    pass
@@ -0,0 +1,111 @@
+import json
+import os
+import time
+import metrics
+from selenium import webdriver
+
+# Restart Chrome after this many uses to keep leaks in check
+MAX_USES = int(os.getenv('DRIVER_MAX_USES', 20))
+# GraphQL operations whose request bodies we keep (see captured_request)
+CAPTURE_OPERATIONS = os.getenv('CAPTURE_OPERATIONS', 'CreateUploadMutation').split(',')
+CAPTURE_PREFIX = 'abCapture:'
+# Runs before the app's own scripts on every page, wrapping XHR and fetch
+CAPTURE_SCRIPT = r"""
+(() => {
+    if (window.__abCapture) return;
+    window.__abCapture = true;
+    const operations = %s;
+    const pattern = new RegExp('\\b(mutation|query)\\s+(' + operations.join('|') + ')\\b');
+    const inspect = body => {
+        if (typeof body !== 'string' || !body.includes('"operationName"') && !pattern.test(body)) return;
+        let requests;
+        try { requests = [].concat(JSON.parse(body)); } catch (e) { return; }
+        for (const request of requests) {
+            const match = (request.query || '').match(pattern);
+            const name = operations.includes(request.operationName) ? request.operationName : match && match[2];
+            if (name) sessionStorage.setItem('%s' + name, JSON.stringify(request));
+        }
+    };
+    const send = XMLHttpRequest.prototype.send;
+    XMLHttpRequest.prototype.send = function (body) { inspect(body); return send.apply(this, arguments); };
+    const fetch = window.fetch;
+    window.fetch = function (input, init) { inspect(init && init.body); return fetch.apply(this, arguments); };
+})();"""
+
+
+def launch_driver(chrome_options=None):
+    driver = webdriver.Chrome(chrome_options=chrome_options)
+    driver.execute_cdp_cmd('Page.addScriptToEvaluateOnNewDocument', {
+        "source": CAPTURE_SCRIPT % (json.dumps(CAPTURE_OPERATIONS), CAPTURE_PREFIX),
+    })
+    return driver
+
+
+def captured_request(driver, operation):
+    """Last captured request for a GraphQL operation on this origin, or None."""
+    request = driver.execute_script("return sessionStorage.getItem(arguments[0]);", CAPTURE_PREFIX + operation)
+    return json.loads(request) if request else None
+
+
+def clear_captured(driver, operation):
+    driver.execute_script("sessionStorage.removeItem(arguments[0]);", CAPTURE_PREFIX + operation)
+
+
+class DriverManager:
+    """Keeps one healthy Chrome per container, reused by warm Lambda invocations."""
+
+    def __init__(self, chrome_options=None, max_uses=MAX_USES):
+        # Called for each launch, since options can't be shared between drivers
+        self.chrome_options = chrome_options
+        self.max_uses = max_uses
+        self.driver = None
+        self.uses = 0
+
+    def get(self):
+        start = time.perf_counter()
+        if self.driver is not None and self.uses >= self.max_uses:
+            print('Restarting Chrome after %d uses' % self.uses)
+            self.quit()
+        if self.driver is not None and not self.healthy():
+            print('Restarting unresponsive Chrome')
+            self.quit()
+        if self.driver is not None:
+            try:
+                self.reset()
+            except Exception as e:
+                print('Restarting Chrome that failed to reset: %s' % e)
+                self.quit()
+        cold = self.driver is None
+        if cold:
+            self.driver = launch_driver(self.chrome_options() if self.chrome_options else None)
+            self.uses = 0
+        self.uses += 1
+        metrics.emit('driver_start', time.perf_counter() - start, start='cold' if cold else 'warm', uses=self.uses)
+        return self.driver
+
+    def healthy(self):
+        # A dead chromedriver raises urllib3/connection errors rather than WebDriverException
+        try:
+            return self.driver.execute_script('return 1') == 1
+        except Exception:
+            return False
+
+    def reset(self):
+        """Leave the browser as a fresh launch would, but keep cookies so logins carry over."""
+        driver = self.driver
+        handles = driver.window_handles
+        for handle in handles[1:]:
+            driver.switch_to.window(handle)
+            driver.close()
+        driver.switch_to.window(handles[0])
+        driver.get('about:blank')
+
+    def quit(self):
+        if self.driver is None:
+            return
+        try:
+            self.driver.quit()
+        except Exception:
+            pass
+        self.driver = None
+        self.uses = 0
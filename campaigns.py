@@ -0,0 +1,104 @@
+import os
+
+# Keys of people field maps that set the wizard's type dropdowns rather than map a column
+PEOPLE_SETTINGS = ['email_type', 'phone_type']
+# engine: api replays requests that have only been checked against dev/fake_ab.py,
+# so campaigns asking for it drive the wizard unless this is set
+API_ENGINE_ENABLED = os.getenv('API_ENGINE_ENABLED', '').lower() in ('1', 'true', 'yes')
+
+
+def parse_config(config_path, campaign_key):
+    import yaml
+    with open(config_path) as file:
+        config = yaml.load(file, Loader=yaml.FullLoader)
+    return campaign_config(config, campaign_key)
+
+
+def campaign_config(config, campaign_key):
+    """One campaign's settings from a loaded config file, with its fields checked and indexed."""
+    if campaign_key not in config:
+        raise CampaignError(
+            'Could not find campaign %s in config file' % campaign_key)
+    campaign = config[campaign_key]
+    parsed = {
+        "instance": config['instance'],
+        "campaign_name": campaign['campaign_name'],
+        "field_map": campaign['fields'],
+        # selenium drives the upload wizard; api replays its GraphQL calls
+        "engine": campaign.get('engine', config.get('engine', 'selenium')),
+    }
+    if parsed['engine'] == 'api' and not API_ENGINE_ENABLED:
+        print('API upload engine is disabled (API_ENGINE_ENABLED), using selenium for %s' % campaign_key)
+        parsed['engine'] = 'selenium'
+    # Rows per chunk when there's no throughput history to go on
+    parsed['chunk_size'] = campaign.get('chunk_size', config.get('chunk_size', 5000))
+    # Executions allowed to run at once on the instance and per campaign. Each holds one
+    # lease but uploads `chunks` at a time, so only chunks: 1 keeps the instance limit exact
+    parsed['concurrency'] = {
+        "instance": 1,
+        "campaign": 1,
+        "chunks": 1,
+        **config.get('concurrency', {}),
+        **campaign.get('concurrency', {}),
+    }
+    # Bad rows fail the whole file (reject), are set aside (quarantine), or aren't checked (off).
+    # Off unless asked for, since campaigns set up before it may have rows reject would fail
+    parsed['validation'] = campaign.get('validation', config.get('validation', 'off'))
+    default_backend = 'api' if parsed['engine'] == 'api' else 'selenium'
+    parsed['status_backend'] = campaign.get('status_backend', config.get('status_backend', default_backend))
+    # delta only uploads rows that changed since the last Complete upload
+    # coalesce_window merges files arriving within that many seconds into one execution
+    for setting in ['poll_interval', 'map_mode', 'delta', 'full_refresh', 'coalesce_window']:
+        if setting in campaign or setting in config:
+            parsed[setting] = campaign.get(setting, config.get(setting))
+    if config.get('base_url'):
+        parsed['base_url'] = config['base_url']
+    # Columns each upload type sends, in upload order
+    parsed['columns'] = compile_fields(parsed['field_map'])
+    return parsed
+
+
+def compile_fields(field_map):
+    """Check a campaign's fields and return {upload type: columns it sends}."""
+    errors = []
+    id_map = field_map.get('id') or {}
+    if not id_map.get('column') or not id_map.get('ab_type'):
+        errors.append('id needs a column and an ab_type')
+    for upload_type, type_map in field_map.items():
+        if upload_type == 'id':
+            continue
+        if 'people' not in upload_type and 'info' not in upload_type:
+            errors.append('%s is neither a people nor an info upload' % upload_type)
+        elif not isinstance(type_map, dict):
+            errors.append('%s should map columns to fields' % upload_type)
+        elif 'people' in upload_type:
+            errors += ['%s.%s should be a field name' % (upload_type, column)
+                       for column, field in type_map.items() if field is not None and not isinstance(field, str)]
+        else:
+            errors += ['%s.%s needs a name and a type' % (upload_type, column)
+                       for column, field_info in type_map.items()
+                       if not isinstance(field_info, dict) or not field_info.get('name') or not field_info.get('type')]
+    if errors:
+        raise CampaignError('Invalid fields: %s' % '; '.join(errors))
+    return {t: upload_columns(field_map, t) for t in field_map if t != 'id'}
+
+
+def upload_columns(field_map, upload_type):
+    """The id column and the columns an upload type maps, including info sub-columns."""
+    type_map = field_map[upload_type]
+    columns = [field_map['id']['column']]
+    if 'people' in upload_type:
+        columns += [column for column, field in type_map.items()
+                    if field and column not in PEOPLE_SETTINGS]
+    else:
+        for column, field_info in type_map.items():
+            columns.append(column)
+            columns += [v for k, v in field_info.items() if k.endswith('_col') and v]
+    return list(dict.fromkeys(columns))
+
+
+class DataError(Exception):
+    pass
+
+class CampaignError(Exception):
+    pass
@@ -0,0 +1,100 @@
+import csv
+import io
+import os
+import time
+from scheduler import DynamoBackend, LocalBackend
+from stream import S3Writer, open_s3, open_text
+
+# A batch whose execution never came to close it is taken over after 2x the window plus this
+STALE_AFTER = 5 * 60
+
+
+def empty_batch():
+    return {"files": [], "execution_name": None, "opened_at": 0}
+
+
+def get_backend():
+    """DynamoDB when BATCH_TABLE is set (Lambda), otherwise the in-memory stand-in."""
+    table = os.getenv('BATCH_TABLE')
+    return DynamoBackend(table, empty_batch) if table else LocalBackend(empty_batch)
+
+
+def batch_key(instance, campaign_key):
+    return '%s/%s' % (instance, campaign_key)
+
+
+def add_file(backend, key, file_key, execution_name, window):
+    """Add a file to the campaign's open batch, opening one if needed.
+
+    Returns the batch's execution name and whether this file opened it (and
+    so should start that execution).
+    """
+    result = {}
+
+    def add(doc):
+        stale = doc['execution_name'] and time.time() > doc['opened_at'] + 2 * window + STALE_AFTER
+        opened = not doc['execution_name'] or stale
+        if opened:
+            doc['execution_name'] = execution_name
+            doc['opened_at'] = time.time()
+        if file_key not in doc['files']:
+            doc['files'].append(file_key)
+        result.update(execution_name=doc['execution_name'], opened=bool(opened))
+        return doc
+
+    backend.update(key, add)
+    return result['execution_name'], result['opened']
+
+
+def close_batch(backend, key, execution_name):
+    """Take the batch's files, in arrival order, so later files open a new batch."""
+    files = []
+
+    def close(doc):
+        files.clear()
+        if doc['execution_name'] != execution_name:
+            # Taken over as stale, so the new execution gets these files
+            return doc
+        files.extend(doc['files'])
+        return empty_batch()
+
+    backend.update(key, close)
+    return files
+
+
+def merge_csv(s3_client, bucket, file_keys, dest_key, id_column):
+    """Merge CSVs into one with a single header and one row per id.
+
+    Columns are matched by name, so files may order (or lack) columns
+    differently. When an id shows up more than once, the row from the newest
+    file wins. Rows without an id are all kept. Returns the rows written.
+    """
+    newest_first = list(reversed(file_keys))
+    headers = []
+    for key in newest_first:
+        body = open_s3(s3_client, bucket, key)
+        headers.append(next(csv.reader(open_text(body)), []))
+        body.close()
+    header = list(dict.fromkeys(c for h in headers for c in h))
+    seen = set()
+    rows = 0
+    with S3Writer(s3_client, bucket, dest_key) as out:
+        out_csv = io.TextIOWrapper(out, encoding='utf-8', newline='')
+        writer = csv.writer(out_csv)
+        writer.writerow(header)
+        for key, file_header in zip(newest_first, headers):
+            reader = csv.reader(open_text(open_s3(s3_client, bucket, key)))
+            next(reader, None)
+            positions = [file_header.index(c) if c in file_header else None for c in header]
+            id_index = file_header.index(id_column) if id_column in file_header else None
+            for row in reader:
+                row_id = row[id_index] if id_index is not None and id_index < len(row) else ''
+                if row_id:
+                    if row_id in seen:
+                        continue
+                    seen.add(row_id)
+                writer.writerow([row[i] if i is not None and i < len(row) else '' for i in positions])
+                rows += 1
+        out_csv.flush()
+        out_csv.detach()
+    return rows
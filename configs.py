@@ -0,0 +1,75 @@
+from botocore.exceptions import ClientError
+
+CONFIG_KEY = 'config.yml'
+# Resolved campaign configs are kept by version for executions that started on them
+SNAPSHOT_TTL = 30 * 24 * 60 * 60
+# What a job's compact config leaves out, to be looked up by version
+FULL_ONLY = ['field_map', 'columns']
+
+# Warm Lambdas reuse these. _files: (bucket, key) -> parsed file and its ETag,
+# _campaigns: (version, campaign key) -> resolved campaign config
+_files = {}
+_campaigns = {}
+
+
+def snapshot_key(version, campaign_key):
+    return '%s/%s' % (version, campaign_key)
+
+
+def load_file(s3_client, bucket, key=CONFIG_KEY):
+    """The parsed config file and its ETag, only downloaded and parsed again when the ETag changes."""
+    cached = _files.get((bucket, key))
+    try:
+        if cached:
+            obj = s3_client.get_object(Bucket=bucket, Key=key, IfNoneMatch=cached['etag'])
+        else:
+            obj = s3_client.get_object(Bucket=bucket, Key=key)
+    except ClientError as e:
+        if cached and e.response['Error']['Code'] in ('304', 'NotModified'):
+            return cached['etag'], cached['config']
+        raise
+    import yaml
+    config = yaml.load(obj['Body'].read(), Loader=yaml.FullLoader)
+    _files[(bucket, key)] = {"etag": obj['ETag'], "config": config}
+    return obj['ETag'], config
+
+
+def get_campaign(s3_client, store, bucket, campaign_key):
+    """A campaign's resolved config, tagged with the config file version it came from.
+
+    Each version is checked and compiled once per container, and saved to the
+    store so executions can keep using it after config.yml changes.
+    """
+    import campaigns
+    etag, config = load_file(s3_client, bucket)
+    version = etag.strip('"')
+    if (version, campaign_key) not in _campaigns:
+        campaign = {
+            **campaigns.campaign_config(config, campaign_key),
+            "version": version,
+            "campaign_key": campaign_key,
+        }
+        store.put(snapshot_key(version, campaign_key), campaign, ttl=SNAPSHOT_TTL)
+        _campaigns[(version, campaign_key)] = campaign
+    return _campaigns[(version, campaign_key)]
+
+
+def compact(config):
+    """What executions carry: every setting but the field map, plus the version to look it up by."""
+    if 'version' not in config:
+        return config
+    return {k: v for k, v in config.items() if k not in FULL_ONLY}
+
+
+def resolve(config, store):
+    """The full config for a job's compact one. Configs without a version are already full."""
+    if 'field_map' in config:
+        return config
+    key = (config['version'], config['campaign_key'])
+    if key not in _campaigns:
+        campaign = store.get(snapshot_key(*key))
+        if campaign is None:
+            from campaigns import CampaignError
+            raise CampaignError('Config version %s of %s is no longer available' % key)
+        _campaigns[key] = campaign
+    return {**_campaigns[key], **config}
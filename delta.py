@@ -0,0 +1,117 @@
+import csv
+import gzip
+import hashlib
+import json
+from botocore.exceptions import ClientError
+from stream import ChunkWriter, open_text
+
+# Fingerprints are truncated blake2b digests, stored as hex
+FINGERPRINT_BYTES = 8
+INDEX_PREFIX = '_state/delta'
+
+
+def index_key(instance, campaign_key):
+    return '%s/%s/%s.json.gz' % (INDEX_PREFIX, instance, campaign_key)
+
+
+def pending_key(instance, campaign_key, execution_name):
+    return '%s/%s/%s.%s.json.gz' % (INDEX_PREFIX, instance, campaign_key, execution_name)
+
+
+def empty_index(upload_types=()):
+    # rows maps each id to its fingerprints for `types`, concatenated in that order
+    return {"types": list(upload_types), "rows": {}}
+
+
+def fingerprint(columns, row):
+    """Hash of the named column values, so a changed mapping changes every fingerprint."""
+    digest = hashlib.blake2b(digest_size=FINGERPRINT_BYTES)
+    for name, i in columns:
+        digest.update(('%s\x1f%s\x1e' % (name, row[i] if i < len(row) else '')).encode('utf-8'))
+    return digest.hexdigest()
+
+
+def load_index(s3_client, bucket, key):
+    """The committed index and its ETag, or an empty index and None."""
+    try:
+        obj = s3_client.get_object(Bucket=bucket, Key=key)
+    except s3_client.exceptions.NoSuchKey:
+        return empty_index(), None
+    return json.loads(gzip.decompress(obj['Body'].read())), obj['ETag']
+
+
+def save_index(s3_client, bucket, key, index):
+    body = gzip.compress(json.dumps(index, separators=(',', ':')).encode('utf-8'))
+    s3_client.put_object(Bucket=bucket, Key=key, Body=body)
+
+
+def commit_index(s3_client, bucket, key, pending, base_etag):
+    """Make a pending index live once its uploads are Complete.
+
+    If another run committed since this one read the index, we can't tell whose
+    rows Action Builder ended up with, so the index is dropped and the next
+    file is uploaded in full.
+    """
+    try:
+        etag = s3_client.head_object(Bucket=bucket, Key=key)['ETag']
+    except ClientError as e:
+        if e.response['Error']['Code'] not in ('404', 'NoSuchKey'):
+            raise
+        etag = None
+    if etag == base_etag:
+        s3_client.copy_object(Bucket=bucket, Key=key, CopySource={'Bucket': bucket, 'Key': pending})
+        print('Committed fingerprint index %s' % key)
+    else:
+        s3_client.delete_object(Bucket=bucket, Key=key)
+        print('Fingerprint index %s changed during upload, next file will be uploaded in full' % key)
+    s3_client.delete_object(Bucket=bucket, Key=pending)
+
+
+def discard_index(s3_client, bucket, pending):
+    s3_client.delete_object(Bucket=bucket, Key=pending)
+
+
+def split_changes(source, s3_client, bucket, file_key, chunk_size, field_map, upload_types,
+                  old_index, full_refresh=False, validator=None, columns=None):
+    """Write the rows each upload type needs to send, and build the new fingerprint index.
+
+    Rows whose columns hash the same as in old_index are left out (all rows
+    are kept with full_refresh). A row that changed for any upload type lands
+    in the same chunk for all of them, so a person's people upload still runs
+    before their info upload. Rows failing the validator, if any, are left
+    out. `columns` is the campaign's compiled {upload type: columns}, if at hand.
+    Returns the number of valid rows, how many of them changed, the files written (as stream.split_csv) and the new index.
+    """
+    from campaigns import DataError, upload_columns
+    reader = csv.reader(open_text(source))
+    header = next(reader, None)
+    index = empty_index(upload_types)
+    if header is None:
+        return 0, 0, [], index
+    id_column = field_map['id']['column']
+    if id_column not in header:
+        raise DataError('ID column %s not found in %s' % (id_column, file_key))
+    id_index = header.index(id_column)
+    if validator:
+        reader = validator.filter(header, reader)
+    columns = {t: columns[t] if columns else upload_columns(field_map, t) for t in upload_types}
+    chunks = ChunkWriter(s3_client, bucket, file_key, header, columns, chunk_size)
+    named = {t: [(header[i], i) for i in chunks.indexes[t]] for t in upload_types}
+    width = FINGERPRINT_BYTES * 2
+    offsets = {t: old_index['types'].index(t) * width for t in upload_types if t in old_index['types']}
+    old_rows = old_index['rows']
+    rows = 0
+    for row in reader:
+        rows += 1
+        row_id = row[id_index] if id_index < len(row) else ''
+        prints = [fingerprint(named[t], row) for t in upload_types]
+        old = old_rows.get(row_id)
+        dirty = [
+            t for t, new in zip(upload_types, prints)
+            if full_refresh or not old or t not in offsets or old[offsets[t]:offsets[t] + width] != new
+        ]
+        if row_id:
+            index['rows'][row_id] = ''.join(prints)
+        if dirty:
+            chunks.writerow(row, dirty)
+    return rows, chunks.rows, chunks.close(), index
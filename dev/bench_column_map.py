@@ -0,0 +1,146 @@
+"""Compare WebDriver round trips for map_mode element vs batch on a wide people mapping.
+
+    python dev/bench_column_map.py --columns 100 --latency 0.004
+
+Runs both mapping paths against an in-process stand-in for chromedriver that
+charges a fixed latency per command, so the numbers reflect round trips only.
+"""
+import argparse
+import os
+import sys
+import time
+from selenium.common.exceptions import NoSuchElementException
+from selenium.webdriver.common.by import By
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from upload import ABUploader
+
+
+class Page:
+    """State of a mapping page: rows of columns and one dropdown overlay."""
+
+    def __init__(self, columns, labels, latency):
+        self.columns = columns
+        self.labels = labels
+        self.latency = latency
+        self.selected = {}
+        self.open_row = None
+        self.commands = 0
+
+    def command(self):
+        self.commands += 1
+        time.sleep(self.latency)
+
+
+class FakeElement:
+
+    def __init__(self, page, kind, row=None, index=None):
+        self.page = page
+        self.kind = kind
+        self.row = row
+        self.index = index
+
+    @property
+    def text(self):
+        self.page.command()
+        return self.page.labels[self.index]
+
+    def get_attribute(self, name):
+        self.page.command()
+        if name == 'value':
+            return self.page.columns[self.row]
+        if name == 'class':
+            selected = self.page.selected.get(self.page.open_row) == self.index
+            return 'mat-option mat-selected' if selected else 'mat-option'
+
+    def click(self):
+        self.page.command()
+        if self.kind == 'select':
+            self.page.open_row = self.row
+        elif self.kind == 'option':
+            self.page.selected[self.page.open_row] = self.index
+            self.page.open_row = None
+        else:
+            self.page.open_row = None
+
+    def find_element(self, by, value):
+        self.page.command()
+        return FakeElement(self.page, 'input' if value == 'input' else 'select', self.row)
+
+    def find_elements(self, by, value):
+        return FakeDriver.find_elements(self, by, value)
+
+
+class FakeDriver:
+
+    def __init__(self, page):
+        self.page = page
+
+    def find_element(self, by, value):
+        elements = self.find_elements(by, value)
+        if not elements:
+            raise NoSuchElementException(value)
+        return elements[0]
+
+    def find_elements(self, by, value):
+        self.page.command()
+        if value == '//mat-option':
+            if self.page.open_row is None:
+                return []
+            return [FakeElement(self.page, 'option', index=i) for i in range(len(self.page.labels))]
+        if value == 'body':
+            return [FakeElement(self.page, 'body')]
+        return [FakeElement(self.page, 'row', row=i) for i in range(len(self.page.columns))]
+
+    def execute_script(self, script, *args):
+        self.page.command()
+        if script == ABUploader.ROW_COLUMNS_SCRIPT:
+            return list(self.page.columns)
+        if script == ABUploader.OPEN_SELECT_SCRIPT:
+            self.page.open_row = args[0]
+        if script == ABUploader.SELECT_OPTION_SCRIPT:
+            self.page.selected[self.page.open_row] = args[0]
+            self.page.open_row = None
+            return None
+        return list(self.page.labels) if self.page.open_row is not None else []
+
+
+def run(mode, columns, latency):
+    labels = [''] + ['Field %d' % i for i in range(columns)]
+    page = Page(['col%d' % i for i in range(columns)], labels, latency)
+    config = {
+        "instance": 'bench',
+        "campaign_name": 'Bench',
+        "field_map": {"people": {'col%d' % i: 'Field %d' % i for i in range(columns)}},
+        "map_mode": mode,
+        "poll_interval": latency,
+    }
+    uploader = ABUploader(config, no_login=True)
+    uploader._driver = FakeDriver(page)
+    stdout, sys.stdout = sys.stdout, open(os.devnull, 'w')
+    start = time.perf_counter()
+    try:
+        if mode == 'batch':
+            uploader.batch_map_people_fields('people')
+        else:
+            rows = uploader.driver.find_elements(By.CLASS_NAME, 'mapping--tight')
+            uploader.map_people_fields('people', rows)
+    finally:
+        sys.stdout = stdout
+    elapsed = time.perf_counter() - start
+    assert page.selected == {i: i + 1 for i in range(columns)}, 'Wrong mapping for %s' % mode
+    print('%-8s %6d commands %8.2fs' % (mode, page.commands, elapsed))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--columns', type=int, default=100)
+    parser.add_argument('--latency', type=float, default=0.004, help='Seconds per chromedriver command')
+    args = parser.parse_args()
+    print('%d mapped columns, %.1fms per command' % (args.columns, args.latency * 1000))
+    for mode in ['element', 'batch']:
+        run(mode, args.columns, args.latency)
+
+
+if __name__ == '__main__':
+    main()
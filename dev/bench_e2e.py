@@ -0,0 +1,142 @@
+"""Wall time of each upload phase, driving Chrome through dev/fake_ab.py's web app.
+
+    python dev/bench_e2e.py --columns 5,25,50 --rows 100,10000 --map-mode element,batch
+
+Needs Chrome (or chrome-headless-shell) and a matching chromedriver on PATH,
+and the urllib3 requirements.txt pins (selenium 3.141 fails on urllib3 2). Each combination uploads a generated
+CSV with that many mapped people columns through ABUploader: login, the
+wizard steps of start_upload (from uploader.timings), get_upload_status
+polled until Complete, then finish_upload. One browser is shared across
+runs, as a warm Lambda would, so only the first login is a full one. The
+fake processes each upload for --delay seconds plus --row-delay per row.
+"""
+import argparse
+import csv
+import itertools
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+# Columns of the default field map that every generated file has
+BASE_PEOPLE = ['first_name', 'last_name', 'email1', 'cell', 'address', 'city', 'state', 'zip']
+INFO_COLUMNS = ['local', 'sector', 'notes', 'notes_note', 'worksite',
+                'worksite_street', 'worksite_city', 'worksite_state', 'worksite_zip']
+PHASES = ['login', 'open wizard', 'send file', 'select campaign', 'match ids', 'map fields', 'validate',
+          'confirm upload', 'map responses', 'create responses', 'status', 'finish']
+
+
+def chrome_options(headed=False):
+    from selenium import webdriver
+    options = webdriver.ChromeOptions()
+    if not headed:
+        options.add_argument('--headless')
+    options.add_argument('--no-sandbox')
+    options.add_argument('--window-size=1280,1696')
+    return options
+
+
+def make_csv(path, extra, rows):
+    header = ['id'] + BASE_PEOPLE + ['custom%d' % (i + 1) for i in range(extra)] + INFO_COLUMNS
+    with open(path, 'w', newline='') as file:
+        writer = csv.writer(file)
+        writer.writerow(header)
+        for n in range(rows):
+            writer.writerow(
+                [n + 1, 'First%d' % n, 'Last%d' % n, 'person%d@example.org' % n, '555%07d' % n,
+                 '%d Main St' % n, 'Dayton', 'OH', '45402']
+                + ['value%d' % i for i in range(extra)]
+                + ['10%d' % (n % 10), 'Public', 'Note', 'Call back', 'Plant', '1 Main St', 'Dayton', 'OH', '45402'])
+
+
+def make_config(app, extra, map_mode, poll_interval):
+    from campaigns import parse_config
+    config = parse_config(os.path.join(ROOT, 'config.example.yml'), 'upload-test')
+    people = {**config['field_map']['people']}
+    people.update(('custom%d' % (i + 1), 'Custom Field %d' % (i + 1)) for i in range(extra))
+    config['field_map'] = {**config['field_map'], "people": people}
+    config.update(base_url=app.base_url, map_mode=map_mode, poll_interval=poll_interval, status_backend='selenium')
+    return config
+
+
+def run(manager, store, upload_type, config, upload_file, status_interval):
+    from upload import ABUploader
+    uploader = ABUploader(config, upload_file, session_store=store, driver_factory=manager.get)
+    phases = {}
+    start = time.perf_counter()
+    uploader.driver
+    phases['login'] = time.perf_counter() - start
+    uploader.start_upload(upload_type)
+    phases.update(uploader.timings)
+    start = time.perf_counter()
+    polls = 1
+    while uploader.get_upload_status() != 'Complete':
+        time.sleep(status_interval)
+        polls += 1
+    phases['status'] = time.perf_counter() - start
+    start = time.perf_counter()
+    uploader.finish_upload()
+    phases['finish'] = time.perf_counter() - start
+    return phases, polls
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--columns', default='8,25', help='Mapped people columns per file (at least 8), comma separated')
+    parser.add_argument('--rows', default='100,5000', help='Rows per file, comma separated')
+    parser.add_argument('--types', default='people', help='people, info or both, comma separated')
+    parser.add_argument('--map-mode', default='element', help='element, batch or both, comma separated')
+    parser.add_argument('--runs', type=int, default=1)
+    parser.add_argument('--delay', type=float, default=2.0, help='Seconds each upload spends processing')
+    parser.add_argument('--row-delay', type=float, default=0.0001, help='Extra processing seconds per row')
+    parser.add_argument('--validation-delay', type=float, default=0.1)
+    parser.add_argument('--poll-interval', type=float, default=0.2, help='Wizard wait poll interval')
+    parser.add_argument('--status-interval', type=float, default=1.0, help='Seconds between status checks')
+    parser.add_argument('--headed', action='store_true', help='Show the browser')
+    args = parser.parse_args()
+    widths = [int(c) for c in args.columns.split(',')]
+    row_counts = [int(r) for r in args.rows.split(',')]
+
+    from browser import DriverManager
+    from fake_ab import FakeActionBuilder
+    from store import LocalStore
+    extra = max(widths) - len(BASE_PEOPLE)
+    app = FakeActionBuilder(processing_delay=args.delay, row_delay=args.row_delay,
+                            validation_delay=args.validation_delay, extra_fields=max(extra, 0)).start()
+    os.environ['AB_LOGIN'], os.environ['AB_PASSWORD'] = app.email, app.password
+    manager = DriverManager(lambda: chrome_options(args.headed))
+    results = []
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            store = LocalStore(os.path.join(tmp, 'sessions'))
+            for width, rows, upload_type, map_mode in itertools.product(
+                    widths, row_counts, args.types.split(','), args.map_mode.split(',')):
+                extra = max(width - len(BASE_PEOPLE), 0)
+                upload_file = os.path.join(tmp, 'bench_%d_%d.csv' % (width, rows))
+                if not os.path.exists(upload_file):
+                    make_csv(upload_file, extra, rows)
+                config = make_config(app, extra, map_mode, args.poll_interval)
+                runs = [run(manager, store, upload_type, config, upload_file, args.status_interval)
+                        for _ in range(args.runs)]
+                results.append(((upload_type, map_mode, width, rows), runs))
+    finally:
+        manager.quit()
+        app.stop()
+
+    phases = [p for p in PHASES if any(p in timings for _, runs in results for timings, _ in runs)]
+    print('\n%-7s %-8s %5s %7s %6s %s %8s' % (
+        'type', 'mode', 'cols', 'rows', 'polls', ' '.join('%16s' % p for p in phases), 'total'))
+    for (upload_type, map_mode, width, rows), runs in results:
+        medians = {p: statistics.median(r.get(p, 0) for r, _ in runs) for p in phases}
+        print('%-7s %-8s %5d %7d %6d %s %7.2fs' % (
+            upload_type, map_mode, width, rows, max(polls for _, polls in runs),
+            ' '.join('%15.2fs' % medians[p] for p in phases), sum(medians.values())))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,137 @@
+"""Cold start cost of each Lambda entry point in handler.py.
+
+    python dev/bench_startup.py --runs 3
+
+Each run is a fresh interpreter that imports handler and calls one entry
+point with a made-up event, the way a cold Lambda would. Reports import time
+(from -X importtime), time to return, peak RSS and which heavy modules got
+loaded. AWS calls are pointed at a closed port, so they fail fast once the
+imports are done; status checks go to dev/fake_ab.py.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+HEAVY = ['selenium', 'yaml', 'chardet', 'upload', 'browser', 'stream']
+CHILD = r"""
+import json, resource, sys, time
+sys.stderr.write('--- handler ---\n')
+start = time.perf_counter()
+import handler
+name, event = sys.argv[1], json.loads(sys.argv[2])
+error = None
+try:
+    getattr(handler, name)(event, None)
+except Exception as e:
+    error = type(e).__name__
+print(json.dumps({
+    "seconds": time.perf_counter() - start,
+    "rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    "heavy": [m for m in %r if m in sys.modules],
+    "error": error,
+}))
+""" % HEAVY
+
+
+def events(config, upload_name):
+    job = {
+        "execution_name": 'campaign-foo_1',
+        "config": config,
+        "bucket": 'bench',
+        "campaign_key": 'campaign-foo',
+        "file_key": 'campaign-foo_bench.csv',
+        "upload_status": {"people": ''},
+    }
+    return {
+        "s3_handler": {"Records": [{"s3": {"bucket": {"name": 'bench'}, "object": {"key": job['file_key']}}}]},
+        "acquire_lease": {"job": job, "token": 'bench-token'},
+        "release_lease": {"detail": {"input": json.dumps(job), "status": 'SUCCEEDED'}},
+        "sweep_leases": {},
+        "start_upload": {**job, "uploads_todo": ['people'], "files": {"people": job['file_key']}},
+        "check_upload_status": {
+            **job, "current_upload": 'people', "upload_name": upload_name, "uploads_todo": [],
+            "started_at": 0, "upload_stats": {"rows": 1, "columns": 1, "bytes": 1},
+        },
+        "collect_chunks": {**job, "chunk_results": [], "chunk_jobs": []},
+        "notify": job,
+    }
+
+
+def import_seconds(stderr):
+    # Top-level lines of -X importtime output: "import time: self | cumulative | name"
+    total = 0
+    for line in stderr.split('--- handler ---', 1)[-1].splitlines():
+        if line.startswith('import time:') and not line.split('|')[2].startswith('  '):
+            fields = line.split('|')
+            if fields[1].strip().isdigit():
+                total += int(fields[1])
+    return total / 1e6
+
+
+def run(name, event, env):
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', CHILD, name, json.dumps(event)],
+        cwd=ROOT, env=env, capture_output=True, text=True)
+    lines = result.stdout.strip().splitlines()
+    if result.returncode or not lines:
+        raise RuntimeError('%s crashed:\n%s' % (name, result.stderr[-2000:]))
+    stats = json.loads(lines[-1])
+    stats['import_seconds'] = import_seconds(result.stderr)
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--runs', type=int, default=3)
+    parser.add_argument('functions', nargs='*', help='Entry points to measure (default all)')
+    args = parser.parse_args()
+
+    from fake_ab import FakeActionBuilder
+    from store import LocalStore
+    from campaigns import parse_config
+    app = FakeActionBuilder().start()
+    try:
+        config = parse_config(os.path.join(ROOT, 'config.example.yml'), 'campaign-foo')
+        config.update(base_url=app.base_url, status_backend='api')
+        app.add_upload('bench-upload', delay=3600)
+        with tempfile.TemporaryDirectory() as state_dir:
+            LocalStore(os.path.join(state_dir, 'sessions')).put(config['instance'], app.session())
+            env = {
+                **os.environ,
+                "STATE_DIR": state_dir,
+                "AWS_DEFAULT_REGION": 'us-east-1',
+                "AWS_ACCESS_KEY_ID": 'bench',
+                "AWS_SECRET_ACCESS_KEY": 'bench',
+                "AWS_MAX_ATTEMPTS": '1',
+                "AWS_RETRY_MODE": 'standard',
+                # Nothing listens on port 9, so AWS calls fail right away
+                "HTTPS_PROXY": 'http://127.0.0.1:9',
+                "NO_PROXY": 'localhost,127.0.0.1',
+            }
+            env.pop('STATE_BUCKET', None)
+            env.pop('LEASE_TABLE', None)
+            print('%-20s %9s %9s %8s  %s' % ('function', 'import', 'total', 'rss', 'heavy modules'))
+            for name, event in events(config, 'bench-upload').items():
+                if args.functions and name not in args.functions:
+                    continue
+                runs = [run(name, event, env) for _ in range(args.runs)]
+                print('%-20s %8.0fms %8.0fms %6.0fMB  %s' % (
+                    name,
+                    statistics.median(r['import_seconds'] for r in runs) * 1000,
+                    statistics.median(r['seconds'] for r in runs) * 1000,
+                    max(r['rss_mb'] for r in runs),
+                    ', '.join(runs[-1]['heavy']) or '-'))
+    finally:
+        app.stop()
+
+
+if __name__ == '__main__':
+    main()
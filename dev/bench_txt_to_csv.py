@@ -0,0 +1,85 @@
+"""Compare the streaming txt_to_csv against the original whole-file version.
+
+    python dev/bench_txt_to_csv.py --rows 1000000
+
+Each implementation runs in its own interpreter so peak RSS is measured separately.
+"""
+import argparse
+import csv
+import os
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+
+def legacy_txt_to_csv(txt_file, csv_file):
+    import chardet
+    encoding = chardet.detect(open(txt_file, 'rb').read())['encoding']
+    with open(txt_file, "r", encoding=encoding) as in_text, open(csv_file, "w") as out_csv:
+        data = (line.replace('\0', '') for line in in_text)
+        in_reader = csv.reader(data, delimiter='\t')
+        out_writer = csv.writer(out_csv)
+        for row in in_reader:
+            row = [col.strip() for col in row]
+            out_writer.writerow(row)
+
+
+def stream_txt_to_csv(txt_file, csv_file):
+    from stream import convert_txt
+    with open(txt_file, 'rb') as in_text, open(csv_file, 'wb') as out_csv:
+        convert_txt(in_text, out_csv)
+
+
+IMPLEMENTATIONS = {
+    'legacy': legacy_txt_to_csv,
+    'stream': stream_txt_to_csv,
+}
+
+
+def make_txt(path, rows):
+    names = ['José', 'Zoë', 'Mary', 'Li', 'Renée', 'Omar', 'Chloé']
+    random.seed(0)
+    with open(path, 'w', encoding='cp1252', newline='') as out:
+        out.write('id\tfirst_name\tlast_name\temail1\tcell\tcity\tstate\tzip\tlocal\n')
+        for i in range(rows):
+            out.write('%d\t %s \t%s\0\tuser%d@example.org\t555-%07d\tSpringfield \tIL\t%05d\t%d\n' % (
+                i, random.choice(names), random.choice(names), i, i, i % 99999, i % 500))
+
+
+def run_one(name, txt_file):
+    csv_file = txt_file + '.%s.csv' % name
+    start = time.perf_counter()
+    IMPLEMENTATIONS[name](txt_file, csv_file)
+    elapsed = time.perf_counter() - start
+    with open(csv_file) as f:
+        rows = sum(1 for _ in f) - 1
+    os.remove(csv_file)
+    peak_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print('%-8s %10d rows %8.1fs %12.0f rows/sec %8.1f MB peak RSS' % (
+        name, rows, elapsed, rows / elapsed, peak_mb))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=1000000)
+    parser.add_argument('--only', choices=IMPLEMENTATIONS)
+    parser.add_argument('--run', nargs=2, metavar=('IMPL', 'FILE'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.run:
+        return run_one(*args.run)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        txt_file = os.path.join(tmp, 'bench.txt')
+        make_txt(txt_file, args.rows)
+        print('Input: %d rows, %.1f MB' % (args.rows, os.path.getsize(txt_file) / 1e6))
+        for name in [args.only] if args.only else IMPLEMENTATIONS:
+            subprocess.run([sys.executable, __file__, '--run', name, txt_file], check=True)
+
+
+if __name__ == '__main__':
+    main()
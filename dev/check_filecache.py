@@ -0,0 +1,84 @@
+"""Exercise FileCache with a real boto3 S3 client, stubbed so no AWS calls are made.
+
+    python dev/check_filecache.py
+
+The stubber validates each call's parameters against the S3 API model, so
+arguments boto3 doesn't accept fail here as they would in Lambda.
+"""
+import io
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import boto3
+from botocore.response import StreamingBody
+from botocore.stub import Stubber
+from filecache import FileCache
+
+BUCKET = 'uploads'
+
+
+def expect_head(stubber, key, data, etag):
+    stubber.add_response('head_object', {"ETag": etag, "ContentLength": len(data)}, {"Bucket": BUCKET, "Key": key})
+
+
+def expect_get(stubber, key, data, etag):
+    body = StreamingBody(io.BytesIO(data), len(data))
+    stubber.add_response('get_object', {"Body": body, "ETag": etag, "ContentLength": len(data)},
+                         {"Bucket": BUCKET, "Key": key, "IfMatch": etag})
+
+
+def main():
+    s3 = boto3.client('s3', region_name='us-east-1', aws_access_key_id='x', aws_secret_access_key='x')
+    root = tempfile.mkdtemp()
+    try:
+        cache = FileCache(s3, root, max_bytes=250)
+        with Stubber(s3) as stubber:
+            # Miss downloads, and the file keeps its name for the upload wizard
+            expect_head(stubber, 'drop/x.csv', b'1' * 100, '"a1"')
+            expect_get(stubber, 'drop/x.csv', b'1' * 100, '"a1"')
+            path = cache.get(BUCKET, 'drop/x.csv')
+            assert os.path.basename(path) == 'x.csv'
+            with open(path, 'rb') as file:
+                assert file.read() == b'1' * 100
+            # Hit only checks the ETag
+            expect_head(stubber, 'drop/x.csv', b'1' * 100, '"a1"')
+            assert cache.get(BUCKET, 'drop/x.csv') == path
+            time.sleep(0.01)
+            expect_head(stubber, 'y.csv', b'2' * 100, '"b1"')
+            expect_get(stubber, 'y.csv', b'2' * 100, '"b1"')
+            cache.get(BUCKET, 'y.csv')
+            time.sleep(0.01)
+            expect_head(stubber, 'drop/x.csv', b'1' * 100, '"a1"')
+            cache.get(BUCKET, 'drop/x.csv')
+            time.sleep(0.01)
+            # No room for a third, so y.csv (least recently used) goes
+            expect_head(stubber, 'z.csv', b'3' * 100, '"c1"')
+            expect_get(stubber, 'z.csv', b'3' * 100, '"c1"')
+            cache.get(BUCKET, 'z.csv')
+            assert len(os.listdir(root)) == 2
+            # A new version is downloaded again
+            expect_head(stubber, 'drop/x.csv', b'9' * 10, '"a2"')
+            expect_get(stubber, 'drop/x.csv', b'9' * 10, '"a2"')
+            with open(cache.get(BUCKET, 'drop/x.csv'), 'rb') as file:
+                assert file.read() == b'9' * 10
+            # A failed download leaves nothing behind that looks cached
+            expect_head(stubber, 'w.csv', b'4' * 10, '"d1"')
+            stubber.add_client_error('get_object', 'PreconditionFailed', http_status_code=412)
+            try:
+                cache.get(BUCKET, 'w.csv')
+                raise AssertionError('expected PreconditionFailed')
+            except s3.exceptions.ClientError:
+                pass
+            assert not any(f.endswith('.tmp') or f == 'w.csv' for _, _, files in os.walk(root) for f in files)
+            stubber.assert_no_pending_responses()
+    finally:
+        shutil.rmtree(root)
+    print('File cache OK')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,51 @@
+"""Exercise LeaseScheduler against the in-memory backend.
+
+    python dev/check_scheduler.py
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from scheduler import LeaseScheduler, LocalBackend
+
+
+def holders(granted):
+    return [g['holder'] for g in granted]
+
+
+def main():
+    scheduler = LeaseScheduler(LocalBackend())
+    limits = {"instance": 2, "campaign": 1}
+    assert holders(scheduler.acquire('demo', 'a1', 'a', limits, 't-a1')) == ['a1']
+    # Same campaign waits, another campaign on the same instance goes ahead
+    assert holders(scheduler.acquire('demo', 'a2', 'a', limits, 't-a2')) == []
+    assert holders(scheduler.acquire('demo', 'b1', 'b', limits, 't-b1')) == ['b1']
+    # Instance is full, and other instances are unaffected
+    assert holders(scheduler.acquire('demo', 'c1', 'c', limits, 't-c1')) == []
+    assert holders(scheduler.acquire('other', 'a3', 'a', limits, 't-a3')) == ['a3']
+    # Retried acquire doesn't queue twice
+    assert holders(scheduler.acquire('demo', 'a2', 'a', limits, 't-a2')) == []
+    # FIFO: a2 was queued before c1
+    assert holders(scheduler.release('demo', 'a1')) == ['a2']
+    assert holders(scheduler.release('demo', 'b1')) == ['c1']
+    # Crashed holders expire
+    expiring = LeaseScheduler(scheduler.backend, lease_ttl=0.1)
+    assert holders(expiring.acquire('solo', 'x1', 'x', {"instance": 1}, 't-x1')) == ['x1']
+    assert holders(expiring.acquire('solo', 'x2', 'x', {"instance": 1}, 't-x2')) == []
+    time.sleep(0.2)
+    assert holders(expiring.sweep()['solo']) == ['x2']
+    # Renewed holders don't, however long they run
+    expiring = LeaseScheduler(scheduler.backend, lease_ttl=0.2)
+    assert holders(expiring.acquire('long', 'y1', 'y', {"instance": 1}, 't-y1')) == ['y1']
+    assert holders(expiring.acquire('long', 'y2', 'y', {"instance": 1}, 't-y2')) == []
+    for _ in range(3):
+        time.sleep(0.1)
+        assert expiring.renew('long', 'y1')
+    assert holders(expiring.sweep()['long']) == []
+    assert not expiring.renew('long', 'y2')
+    print('Lease scheduler OK')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,626 @@
+"""Local stand-in for Action Builder, so uploads can be exercised offline.
+
+    python dev/fake_ab.py --port 8800     # serve until Ctrl-C
+    python dev/fake_ab.py --check         # run the API clients against it and exit
+
+Point a config at it with `base_url: http://localhost:8800`. Besides the
+GraphQL API it serves the pages ABUploader drives: login, the people and
+fields upload wizards and /admin/upload/list. Those reproduce just the
+elements and behaviour the uploader relies on (see dev/bench_e2e.py).
+"""
+import argparse
+import html
+import json
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+SESSION_COOKIE = 'ab_session'
+PEOPLE_FIELDS = ['First Name', 'Last Name', 'Email', 'Phone Number', 'Phone Number Type',
+                 'Street Address', 'City', 'State', 'Zip/Postal Code']
+INFO_FIELDS = [
+    {"name": 'Local #', "section": 'Union Information', "type": 'Field'},
+    {"name": 'Sector', "section": 'General', "type": 'Field'},
+    {"name": 'Foo', "section": 'General', "type": 'Field'},
+    {"name": 'Notes Category', "section": 'General', "type": 'notes'},
+    {"name": 'Worksite', "section": 'General', "type": 'address'},
+]
+
+PAGE = """<!doctype html>
+<html>
+<head>
+<meta charset="utf-8">
+<title>%(title)s | Action Builder</title>
+<style>%(style)s</style>
+</head>
+<body>
+%(body)s
+<script>const AB = %(config)s;</script>
+<script>%(script)s</script>
+</body>
+</html>"""
+STYLE = """
+body { font-family: sans-serif; margin: 0; padding: 16px; }
+app-home, app-login-box, app-campaign-select2, app-list-item, app-upload-field-selector, mat-select,
+mat-option, mat-list-option, mat-subheader, mat-checkbox, mat-dialog-container { display: block; }
+app-campaign-select2, app-upload-field-selector, mat-select { border: 1px solid #999; min-height: 22px; width: 240px; margin: 4px 0; cursor: pointer; }
+mat-select[aria-disabled=true] { color: #999; cursor: default; }
+.mapping--tight { display: flex; gap: 8px; align-items: center; }
+.cdk-overlay-backdrop { position: fixed; top: 0; right: 0; bottom: 0; left: 0; z-index: 1000; }
+.overlay-panel { position: absolute; top: 0; left: 0; width: 240px; background: #fff; border: 1px solid #999; z-index: 1001; }
+mat-option, mat-list-option, mat-subheader { min-height: 20px; padding: 2px 4px; }
+mat-option.mat-selected { background: #ddd; }
+mat-dialog-container { position: fixed; top: 80px; left: 320px; width: 280px; padding: 8px; background: #fff; border: 1px solid #999; z-index: 900; }
+.error { color: #c00; }
+"""
+# Helpers shared by every page: element builder, GraphQL and Angular Material-like widgets
+COMMON_SCRIPT = r"""
+function el(tag, attrs, ...children) {
+    const node = document.createElement(tag);
+    for (const [key, value] of Object.entries(attrs || {})) {
+        if (key === 'text') node.textContent = value;
+        else if (key.startsWith('on')) node.addEventListener(key.slice(2), value);
+        else node.setAttribute(key, value);
+    }
+    node.append(...children);
+    return node;
+}
+
+async function graphql(operationName, query, variables) {
+    const response = await fetch('/graphql', {
+        method: 'POST',
+        headers: {'Content-Type': 'application/json'},
+        body: JSON.stringify({operationName, query, variables}),
+    });
+    return response.json();
+}
+
+// Dropdown panels open in an overlay with a backdrop; clicking outside the panel closes it
+let overlay = null;
+function closeOverlay() {
+    if (overlay) overlay.remove();
+    overlay = null;
+}
+function openOverlay(...items) {
+    closeOverlay();
+    overlay = el('div', {class: 'cdk-overlay-container'},
+        el('div', {class: 'cdk-overlay-backdrop', onclick: closeOverlay}),
+        el('div', {class: 'overlay-panel'}, ...items));
+    document.body.append(overlay);
+}
+document.addEventListener('click', event => {
+    if (overlay && !overlay.contains(event.target)) closeOverlay();
+});
+
+// labels[0] is the blank option. Keystrokes on a focused select pick the first matching label.
+function matSelect(placeholder, labels, onChange) {
+    const value = el('span', {class: 'mat-select-value'});
+    const select = el('mat-select', {placeholder, tabindex: '0', 'aria-disabled': 'false'},
+        el('div', {class: 'mat-select-trigger'}, value));
+    select.labels = labels;
+    select.selected = 0;
+    const pick = i => {
+        select.selected = i;
+        value.textContent = select.labels[i];
+        if (onChange) onChange(select.labels[i]);
+    };
+    select.addEventListener('click', event => {
+        event.stopPropagation();
+        if (select.getAttribute('aria-disabled') === 'true') return;
+        openOverlay(...select.labels.map((label, i) => el('mat-option', {
+            class: 'mat-option' + (i === select.selected ? ' mat-selected' : ''),
+            text: label,
+            onclick: () => { closeOverlay(); pick(i); },
+        })));
+    });
+    let typed = '', typedAt = 0;
+    select.addEventListener('keydown', event => {
+        if (event.key.length !== 1 || select.getAttribute('aria-disabled') === 'true') return;
+        typed = (Date.now() - typedAt < 1000 ? typed : '') + event.key.toLowerCase();
+        typedAt = Date.now();
+        const lower = select.labels.map(label => label.toLowerCase());
+        let i = lower.indexOf(typed);
+        if (i < 1) i = lower.findIndex((label, n) => n > 0 && label.startsWith(typed));
+        if (i > 0) pick(i);
+    });
+    return select;
+}
+
+function checkboxes(labels) {
+    return labels.map(text => el('mat-checkbox', {}, el('label', {}, el('input', {type: 'checkbox'}), el('span', {text}))));
+}
+"""
+LOGIN_SCRIPT = r"""
+document.getElementById('loginButton').addEventListener('click', async () => {
+    const result = await graphql('LoginMutation', 'mutation LoginMutation($email: String!, $password: String!) { login(email: $email, password: $password) { token } }', {
+        email: document.getElementById('email').value,
+        password: document.getElementById('password').value,
+    });
+    if (result.errors) document.getElementById('loginError').textContent = result.errors[0].message;
+    else location.href = '/';
+});
+"""
+# Both upload wizards: AB.mode is 'entities' (people) or 'fields' (info)
+WIZARD_SCRIPT = r"""
+const CREATE_UPLOAD = 'mutation CreateUploadMutation($input: CreateUploadInput!) { createUpload(input: $input) { upload { name status } } }';
+const TYPE_SELECTS = {'Email': ['Email Type', ['', 'Home', 'Work']], 'Phone Number': ['Phone Type', ['', 'Home', 'Mobile', 'Work']]};
+const SUB_COLUMNS = {notes: ['note'], address: ['street', 'city', 'state', 'zip', 'lat', 'lon']};
+const people = AB.mode === 'entities';
+const state = {fileId: null, fileName: null, columns: [], campaignId: null, entity: '', idType: '', idColumn: '', mapping: {}};
+const wizard = document.getElementById('wizard');
+
+function parseHeader(text) {
+    const line = text.replace(/^\uFEFF/, '').split(/\r?\n/, 1)[0];
+    const cells = [];
+    let cell = '', quoted = false;
+    for (let i = 0; i < line.length; i++) {
+        const c = line[i];
+        if (quoted && c === '"' && line[i + 1] === '"') { cell += '"'; i++; }
+        else if (c === '"') quoted = !quoted;
+        else if (c === ',' && !quoted) { cells.push(cell); cell = ''; }
+        else cell += c;
+    }
+    cells.push(cell);
+    return cells;
+}
+
+const fileInput = el('input', {type: 'file', accept: '.csv', onchange: async () => {
+    const file = fileInput.files[0];
+    const text = await file.text();
+    const response = await fetch('/upload/file?name=' + encodeURIComponent(file.name), {
+        method: 'POST', headers: {'Content-Type': 'text/csv'}, body: text,
+    });
+    state.fileId = (await response.json()).fileId;
+    state.fileName = file.name;
+    state.columns = parseHeader(text);
+    idColumnSelect.labels = ['', ...state.columns];
+    showIdMatch();
+}});
+
+const campaignList = el('div', {class: 'campaign-list'});
+const campaignInput = el('input', {type: 'text', placeholder: 'Campaign', oninput: () => {
+    const typed = campaignInput.value.toLowerCase();
+    campaignList.replaceChildren(...AB.campaigns
+        .filter(campaign => typed && campaign.name.toLowerCase().startsWith(typed))
+        .map(campaign => el('app-list-item', {text: campaign.name, onclick: event => {
+            event.stopPropagation();
+            state.campaignId = campaign.id;
+            campaignInput.value = campaign.name;
+            campaignList.replaceChildren();
+        }})));
+}});
+const campaignSelect = el('app-campaign-select2', {onclick: () => campaignInput.focus()}, campaignInput, campaignList);
+
+const entitySelect = matSelect('Entity Type', ['', 'People'], value => { state.entity = value; showIdMatch(); });
+const idTypeSelect = matSelect('Id to use for matching', ['', 'Custom ID', 'Action Builder ID'], value => {
+    state.idType = value;
+    idColumnSelect.setAttribute('aria-disabled', value ? 'false' : 'true');
+});
+const idColumnSelect = matSelect('Upload Column', [''], value => {
+    if (value === state.idColumn) return;
+    state.idColumn = value;
+    renderRows();
+});
+idColumnSelect.setAttribute('aria-disabled', 'true');
+const idMatch = el('div', {class: 'id-match', style: 'display: none'}, idTypeSelect, idColumnSelect);
+function showIdMatch() {
+    idMatch.style.display = state.entity && state.fileId ? '' : 'none';
+}
+
+const rows = el('div', {class: 'mapping-rows'});
+const errors = el('div', {class: 'mapping-errors'});
+const reviewButton = el('button', {type: 'button', disabled: '', text: 'Review & Confirm', onclick: showReview});
+const nextButton = el('button', {type: 'button', text: 'Next Step', onclick: showResponsesMap});
+
+function renderRows() {
+    state.mapping = {};
+    rows.replaceChildren(...state.columns.map(column => {
+        const row = el('div', {class: 'mapping--tight'}, el('input', {type: 'text', readonly: '', value: column}));
+        row.append(people ? matSelect('Field', ['', ...AB.peopleFields], field => mapPerson(row, column, field))
+                          : fieldSelector(column));
+        return row;
+    }));
+    if (people) validate();
+}
+
+function mapPerson(row, column, field) {
+    row.querySelectorAll('mat-select.type').forEach(select => select.remove());
+    delete state.mapping[column];
+    if (field) state.mapping[column] = {column, field};
+    if (TYPE_SELECTS[field]) {
+        const [placeholder, labels] = TYPE_SELECTS[field];
+        const select = matSelect(placeholder, labels, type => { state.mapping[column].type = type || null; validate(); });
+        select.classList.add('type');
+        row.append(select);
+    }
+    validate();
+}
+
+// Async validation: the form is ng-pending for a moment after every change
+let validation = null;
+function validate() {
+    wizard.classList.add('ng-pending');
+    reviewButton.disabled = true;
+    clearTimeout(validation);
+    validation = setTimeout(() => {
+        wizard.classList.remove('ng-pending');
+        const problems = Object.keys(state.mapping).length ? [] : ['Map at least one column to a field'];
+        errors.replaceChildren(...problems.map(text => el('div', {class: 'error', text})));
+        reviewButton.disabled = problems.length > 0;
+    }, AB.validationMs);
+}
+
+function showReview() {
+    const processButton = el('button', {type: 'button', disabled: '', text: 'Process Upload', onclick: createUpload});
+    const review = el('div', {class: 'review', onchange: () => {
+        processButton.disabled = review.querySelector('input[type=checkbox]:not(:checked)') !== null;
+    }},
+        el('h3', {text: 'Review & Process Upload'}),
+        ...Object.values(state.mapping).map(m => el('div', {text: m.column + ' -> ' + m.field + (m.type ? ' (' + m.type + ')' : '')})),
+        ...checkboxes(['I have reviewed the field mapping', 'Add these people to the campaign']),
+        processButton);
+    wizard.replaceChildren(review);
+}
+
+function fieldSelector(column) {
+    const selector = el('app-upload-field-selector', {text: 'Select a field'});
+    selector.addEventListener('click', event => {
+        event.stopPropagation();
+        const items = [];
+        const sections = [...new Set(AB.infoFields.map(field => field.section))];
+        for (const section of sections) {
+            items.push(el('mat-subheader', {text: section.toUpperCase()}));
+            for (const field of AB.infoFields.filter(f => f.section === section)) {
+                items.push(el('mat-list-option', {text: field.name, onclick: () => {
+                    closeOverlay();
+                    selector.textContent = field.name;
+                    state.mapping[column] = {column, field: field.name, section: field.section, type: field.type};
+                    if (SUB_COLUMNS[field.type]) openDialog(column, field);
+                }}));
+            }
+        }
+        openOverlay(...items);
+    });
+    return selector;
+}
+
+function openDialog(column, field) {
+    const keys = SUB_COLUMNS[field.type];
+    const chosen = {};
+    const dialog = el('mat-dialog-container', {},
+        el('h2', {text: field.name}),
+        ...keys.map(key => matSelect(key, ['', ...state.columns], value => { chosen[key] = value; })),
+        el('button', {type: 'button', text: 'Apply Field Mapping', onclick: () => {
+            state.mapping[column].subColumns = Object.fromEntries(keys.map(key => [key, chosen[key] || null]));
+            dialog.remove();
+        }}));
+    document.body.append(dialog);
+}
+
+function showResponsesMap() {
+    document.title = 'Map to responses | Action Builder';
+    wizard.replaceChildren(
+        el('app-upload-tag-category-map', {}, ...Object.values(state.mapping).map(m => el('div', {text: m.column + ' -> ' + m.field}))),
+        el('button', {type: 'button', text: 'Next Step', onclick: showCreateResponses}));
+}
+
+function showCreateResponses() {
+    document.title = 'Create Responses | Action Builder';
+    const fields = Object.values(state.mapping).filter(m => m.type === 'Field');
+    const button = el('button', {type: 'button', text: 'Create Responses'});
+    const page = el('app-upload-fields-step3-page', {}, ...checkboxes(fields.map(m => 'Create responses for ' + m.field)), button);
+    button.addEventListener('click', () => {
+        if (button.textContent !== 'Create Responses') return createUpload();
+        button.disabled = true;
+        setTimeout(() => {
+            page.replaceChildren(el('span', {text: 'Response Creation Results'}), ...checkboxes(['Apply responses to people']), button);
+            button.textContent = 'Upload';
+            button.disabled = false;
+        }, AB.responseMs);
+    });
+    wizard.replaceChildren(page);
+}
+
+async function createUpload() {
+    const result = await graphql('CreateUploadMutation', CREATE_UPLOAD, {input: {
+        name: state.fileName + ' ' + (people ? 'people' : 'info') + ' ' + new Date().toISOString(),
+        campaignId: state.campaignId,
+        fileId: state.fileId,
+        uploadType: AB.mode,
+        entityType: state.entity,
+        idMatch: {idType: state.idType, column: state.idColumn},
+        mapping: Object.values(state.mapping),
+        createResponses: !people,
+    }});
+    if (result.errors) wizard.append(el('div', {class: 'error', text: result.errors[0].message}));
+    else location.href = '/admin/upload/list';
+}
+
+wizard.append(
+    el('div', {class: 'mapping'}, fileInput, campaignSelect, entitySelect, idMatch),
+    rows, errors, people ? reviewButton : nextButton);
+"""
+LOGIN_BODY = """<app-login-box>
+<input id="email" type="email" placeholder="Email">
+<input id="password" type="password" placeholder="Password">
+<button id="loginButton" type="button">Log In</button>
+<div id="loginError"></div>
+</app-login-box>"""
+# path: (wizard mode, title)
+APP_PAGES = {
+    '/admin/upload/entities/mapping': ('entities', 'Upload People'),
+    '/admin/upload/fields': ('fields', 'Upload Fields'),
+    '/admin/upload/list': (None, 'View Uploads'),
+}
+UPLOAD_ROW = ('<div class="upload-row"><div><span>%(name)s</span></div><div>%(type)s</div><div>%(campaign)s</div>'
+              '<div>%(rows)s</div><div>%(created)s</div><div>%(status)s</div></div>')
+
+
+class FakeActionBuilder:
+
+    def __init__(self, port=0, processing_delay=2.0, campaigns=('Upload Test', 'Foo Campaign'),
+                 row_delay=0.0, validation_delay=0.1, response_delay=1.0, extra_fields=0):
+        # Uploads process for processing_delay plus row_delay per row
+        self.processing_delay = processing_delay
+        self.row_delay = row_delay
+        # How long the people wizard's async validation and the fields wizard's response creation take
+        self.validation_delay = validation_delay
+        self.response_delay = response_delay
+        # 'Custom Field N' people fields, for mapping wide files
+        self.people_fields = PEOPLE_FIELDS + ['Custom Field %d' % (i + 1) for i in range(extra_fields)]
+        self.info_fields = INFO_FIELDS
+        self.token = 'fake-session-token'
+        self.email = 'organizer@example.org'
+        self.password = 'hunter2'
+        self.campaigns = {name: str(i + 1) for i, name in enumerate(campaigns)}
+        self.files = {}
+        self.uploads = {}
+        self.requests = []
+        self.server = ThreadingHTTPServer(('localhost', port), make_handler(self))
+        self.thread = None
+
+    @property
+    def base_url(self):
+        return 'http://localhost:%d' % self.server.server_address[1]
+
+    def session(self):
+        """A saved session as ABUploader.save_session would store it."""
+        return {
+            "cookies": [{"name": SESSION_COOKIE, "value": self.token}],
+            "local_storage": {},
+        }
+
+    def add_upload(self, name, rows=0, delay=None, fail=False, upload_type='People', campaign=''):
+        self.uploads[name] = {
+            "name": name,
+            "type": upload_type,
+            "campaign": campaign,
+            "rows": rows,
+            "created_at": time.time(),
+            "delay": self.processing_delay + rows * self.row_delay if delay is None else delay,
+            "fail": fail,
+        }
+        return self.uploads[name]
+
+    def upload_status(self, upload):
+        if time.time() - upload['created_at'] < upload['delay']:
+            return 'PROCESSING'
+        return 'FAILURE' if upload['fail'] else 'COMPLETE'
+
+    def graphql(self, operation, variables):
+        if operation == 'CampaignsQuery':
+            return {"campaigns": [
+                {"id": id, "name": name} for name, id in self.campaigns.items() if name == variables['name']
+            ]}
+        if operation == 'CreateUploadMutation':
+            upload_input = variables['input']
+            if upload_input['fileId'] not in self.files:
+                raise ValueError('Unknown file %s' % upload_input['fileId'])
+            if upload_input['campaignId'] not in self.campaigns.values():
+                raise ValueError('Unknown campaign %s' % upload_input['campaignId'])
+            rows = self.files[upload_input['fileId']].rstrip(b'\n').count(b'\n')
+            campaign = next(name for name, id in self.campaigns.items() if id == upload_input['campaignId'])
+            upload = self.add_upload(upload_input['name'], rows, campaign=campaign,
+                                     upload_type='Fields' if upload_input.get('uploadType') == 'fields' else 'People')
+            upload['input'] = upload_input
+            return {"createUpload": {"upload": {"name": upload['name'], "status": self.upload_status(upload)}}}
+        if operation == 'UploadStatusQuery':
+            return {"uploads": [
+                {"name": u['name'], "status": self.upload_status(u)}
+                for u in self.uploads.values() if u['name'] == variables['name']
+            ]}
+        raise ValueError('Unknown operation %s' % operation)
+
+    def page(self, path, authorized):
+        """(status, title, body, script, config) for a page of the web app."""
+        if path in ('/', '/login') and authorized:
+            return 200, 'Home', '<app-home><h1>Home</h1></app-home>', '', {}
+        if path in ('/', '/login') or path in APP_PAGES and not authorized:
+            return 200, 'Login', LOGIN_BODY, LOGIN_SCRIPT, {}
+        if path == '/admin/upload/list':
+            return 200, 'View Uploads', self.upload_list(), '', {}
+        if path in APP_PAGES:
+            mode, title = APP_PAGES[path]
+            return 200, title, '<div id="wizard"></div>', WIZARD_SCRIPT, {
+                "mode": mode,
+                "campaigns": [{"id": id, "name": name} for name, id in self.campaigns.items()],
+                "peopleFields": self.people_fields,
+                "infoFields": self.info_fields,
+                "validationMs": self.validation_delay * 1000,
+                "responseMs": self.response_delay * 1000,
+            }
+        return 404, 'Not Found', '<h1>Not Found</h1>', '', {}
+
+    def upload_list(self):
+        rows = ''.join(UPLOAD_ROW % {
+            "name": html.escape(upload['name']),
+            "type": upload['type'],
+            "campaign": html.escape(upload['campaign']),
+            "rows": '{:,}'.format(upload['rows']),
+            "created": time.strftime('%Y-%m-%d %H:%M', time.localtime(upload['created_at'])),
+            "status": self.upload_status(upload).title(),
+        } for upload in sorted(self.uploads.values(), key=lambda u: -u['created_at']))
+        return '<app-upload-list-page><h1>Uploads</h1>%s</app-upload-list-page>' % rows
+
+    def render(self, path, authorized):
+        code, title, body, script, config = self.page(path, authorized)
+        return code, PAGE % {
+            "title": title,
+            "style": STYLE,
+            "body": body,
+            # Keep "</script>" in config values from ending the tag
+            "config": json.dumps(config).replace('</', '<\\/'),
+            "script": COMMON_SCRIPT + script,
+        }
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def make_handler(app):
+
+    class Handler(BaseHTTPRequestHandler):
+
+        def log_message(self, format, *args):
+            pass
+
+        def authorized(self):
+            cookies = dict(c.strip().split('=', 1) for c in self.headers.get('Cookie', '').split(';') if '=' in c)
+            return cookies.get(SESSION_COOKIE) == app.token
+
+        def send_json(self, code, body):
+            data = json.dumps(body).encode('utf-8')
+            self.send_response(code)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            path = self.path.split('?')[0]
+            if path == '/favicon.ico':
+                # A real response, since restore_session sets cookies while on it
+                self.send_response(200)
+                self.send_header('Content-Type', 'image/x-icon')
+                self.send_header('Content-Length', '0')
+                return self.end_headers()
+            code, page = app.render(path, self.authorized())
+            data = page.encode('utf-8')
+            self.send_response(code)
+            self.send_header('Content-Type', 'text/html; charset=utf-8')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+            app.requests.append((self.path, body))
+            path = self.path.split('?')[0]
+            if path not in ('/graphql', '/upload/file'):
+                return self.send_json(404, {"error": "Not found"})
+            request = json.loads(body) if path == '/graphql' else {}
+            if request.get('operationName') == 'LoginMutation':
+                return self.login(request['variables'])
+            if not self.authorized():
+                return self.send_json(401, {"errors": [{"message": "Not authenticated"}]})
+            if path == '/upload/file':
+                file_id = 'file-%d' % (len(app.files) + 1)
+                app.files[file_id] = body
+                return self.send_json(200, {"fileId": file_id})
+            try:
+                data = app.graphql(request['operationName'], request.get('variables', {}))
+            except (KeyError, ValueError) as e:
+                return self.send_json(200, {"errors": [{"message": str(e)}]})
+            self.send_json(200, {"data": data})
+
+        def login(self, variables):
+            if variables.get('email') != app.email or variables.get('password') != app.password:
+                return self.send_json(200, {"errors": [{"message": "Invalid credentials"}]})
+            data = json.dumps({"data": {"login": {"token": None}}}).encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Set-Cookie', '%s=%s; Path=/; HttpOnly' % (SESSION_COOKIE, app.token))
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+    return Handler
+
+
+def check(app):
+    from api import ABClient, SessionError
+    client = ABClient(app.base_url, app.session())
+    app.add_upload('upload-fast', delay=0)
+    app.add_upload('upload-slow', delay=60)
+    app.add_upload('upload-bad', delay=0, fail=True)
+    assert client.get_upload_status('upload-fast') == 'Complete'
+    assert client.get_upload_status('upload-slow') == 'Processing'
+    assert client.get_upload_status('upload-bad') == 'Failure'
+    try:
+        ABClient(app.base_url, {"cookies": []}).get_upload_status('upload-fast')
+        raise AssertionError('Expected SessionError')
+    except SessionError:
+        pass
+    print('Upload status client OK')
+
+    import tempfile
+    from store import LocalStore
+    from api import APIUploader
+    from campaigns import parse_config
+    os.environ['AB_LOGIN'], os.environ['AB_PASSWORD'] = app.email, app.password
+    config = parse_config(os.path.join(os.path.dirname(__file__), '..', 'config.example.yml'), 'campaign-foo')
+    config['base_url'] = app.base_url
+    with tempfile.TemporaryDirectory() as tmp:
+        upload_file = os.path.join(tmp, 'campaign-foo_test.csv')
+        with open(upload_file, 'w') as file:
+            file.write('id,first_name,last_name,email1,cell,local,notes,notes_note,worksite,worksite_city\n')
+            file.write('1,Ana,Diaz,ana@example.org,5555550100,101,Note,Call back,Plant 2,Dayton\n')
+        store = LocalStore(tmp)
+        uploader = APIUploader(config, upload_file, session_store=store)
+        for upload_type in ['people', 'people2', 'info']:
+            name = uploader.start_upload(upload_type)
+            upload_input = app.uploads[name]['input']
+            assert upload_input['idMatch'] == {"idType": 'Custom ID', "column": 'id'}
+        people = APIUploader(config, upload_file, session_store=store).build_mapping(
+            'people', ['id', 'email1', 'cell', 'unmapped'])
+        assert people == [
+            {"column": 'email1', "field": 'Email', "type": 'Home'},
+            {"column": 'cell', "field": 'Phone Number', "type": 'Work'},
+        ], people
+        info = {m['column']: m for m in upload_input['mapping']}
+        assert info['notes']['subColumns'] == {"note": 'notes_note'}
+        assert info['worksite']['subColumns']['city'] == 'worksite_city'
+        assert store.get(config['instance'])['cookies'][0]['value'] == app.token
+    print('API upload engine OK')
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--port', type=int, default=8800)
+    parser.add_argument('--delay', type=float, default=2.0, help='Seconds each upload spends processing')
+    parser.add_argument('--check', action='store_true')
+    args = parser.parse_args()
+    app = FakeActionBuilder(0 if args.check else args.port, args.delay)
+    if args.check:
+        app.start()
+        try:
+            check(app)
+        finally:
+            app.stop()
+        return
+    print('Fake Action Builder on %s' % app.base_url)
+    app.server.serve_forever()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+"""p50/p95 breakdown of the timing records metrics.py prints.
+
+    python dev/metrics_report.py lambda-logs/*.log
+    python dev/metrics_report.py --log-group /aws/lambda/ab-uploader-dev-start_upload --hours 24
+    python dev/metrics_report.py --by upload_type,columns logs.txt
+
+Reads log files (or stdin), or pulls records from CloudWatch Logs. Lines can
+carry any prefix (Lambda adds a timestamp and request id), since only the
+JSON object on each line is read. Records are grouped by phase plus the --by
+fields, e.g. to see how mapping time grows with column count.
+"""
+import argparse
+import fileinput
+import json
+import math
+import time
+from collections import defaultdict
+
+
+def parse(line):
+    start = line.find('{')
+    if start < 0:
+        return None
+    try:
+        record = json.loads(line[start:])
+    except ValueError:
+        return None
+    return record if isinstance(record, dict) and 'phase' in record and 'seconds' in record else None
+
+
+def cloudwatch_lines(log_group, hours):
+    import boto3
+    paginator = boto3.client('logs').get_paginator('filter_log_events')
+    pages = paginator.paginate(
+        logGroupName=log_group,
+        startTime=int((time.time() - hours * 3600) * 1000),
+        filterPattern='{ $.phase = * }')
+    for page in pages:
+        for event in page['events']:
+            yield event['message']
+
+
+def percentile(values, p):
+    # Nearest rank, on sorted values
+    return values[max(math.ceil(p / 100 * len(values)) - 1, 0)]
+
+
+def report(records, by):
+    groups = defaultdict(list)
+    errors = defaultdict(int)
+    for record in records:
+        key = (record['phase'],) + tuple(str(record.get(f, '-')) for f in by)
+        groups[key].append(record['seconds'])
+        if record.get('error'):
+            errors[key] += 1
+    # Spans nest (handler.* contain the rest), so totals overlap rather than add up
+    print('%-28s %s %6s %8s %8s %8s %9s %6s' % (
+        'phase', ''.join('%-14s' % f for f in by), 'count', 'p50', 'p95', 'max', 'total', 'errors'))
+    for key in sorted(groups, key=lambda k: -sum(groups[k])):
+        values = sorted(groups[key])
+        print('%-28s %s %6d %7.2fs %7.2fs %7.2fs %8.1fs %6d' % (
+            key[0], ''.join('%-14s' % v for v in key[1:]), len(values), percentile(values, 50),
+            percentile(values, 95), values[-1], sum(values), errors[key]))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('files', nargs='*', help='Log files (default stdin)')
+    parser.add_argument('--log-group', action='append', help='Read CloudWatch Logs instead (repeatable)')
+    parser.add_argument('--hours', type=float, default=24, help='How far back to read CloudWatch Logs')
+    parser.add_argument('--by', default='', help='Extra fields to group by, comma separated')
+    parser.add_argument('--phase', help='Only phases starting with this, e.g. wizard.')
+    args = parser.parse_args()
+    if args.log_group:
+        lines = (line for group in args.log_group for line in cloudwatch_lines(group, args.hours))
+    else:
+        lines = fileinput.input(args.files)
+    records = [r for r in map(parse, lines) if r and (not args.phase or r['phase'].startswith(args.phase))]
+    if not records:
+        print('No timing records found')
+        return
+    report(records, [f for f in args.by.split(',') if f])
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,65 @@
+import hashlib
+import os
+import shutil
+
+# Lambda's /tmp is 512 MB by default and Chrome keeps its profile there too
+CACHE_DIR = os.getenv('FILE_CACHE_DIR', '/tmp/s3-cache')
+CACHE_BYTES = int(os.getenv('FILE_CACHE_MB', 200)) * 1024 * 1024
+
+
+class FileCache:
+    """S3 objects kept on local disk by bucket, key and ETag, least recently used evicted first.
+
+    Each object gets its own directory and keeps its original file name, since
+    the upload wizard names uploads after the file it's given.
+    """
+
+    def __init__(self, s3_client, root=CACHE_DIR, max_bytes=CACHE_BYTES):
+        self.s3_client = s3_client
+        self.root = root
+        self.max_bytes = max_bytes
+
+    def _dir(self, bucket, key, etag):
+        digest = hashlib.blake2b(('%s/%s/%s' % (bucket, key, etag)).encode('utf-8'), digest_size=16)
+        return os.path.join(self.root, digest.hexdigest())
+
+    def get(self, bucket, key):
+        """Local path of the object's current version, downloading it only if it isn't cached."""
+        head = self.s3_client.head_object(Bucket=bucket, Key=key)
+        entry = self._dir(bucket, key, head['ETag'])
+        path = os.path.join(entry, os.path.basename(key))
+        if os.path.exists(path):
+            print('Using cached copy of %s' % key)
+            os.utime(entry)
+            return path
+        self.evict(head['ContentLength'])
+        os.makedirs(entry, exist_ok=True)
+        # Download then rename so an interrupted download never looks cached
+        tmp_path = '%s.%d.tmp' % (path, os.getpid())
+        try:
+            # IfMatch so a replaced object can't land under the old ETag
+            body = self.s3_client.get_object(Bucket=bucket, Key=key, IfMatch=head['ETag'])['Body']
+            with open(tmp_path, 'wb') as file:
+                shutil.copyfileobj(body, file, 1024 * 1024)
+            os.replace(tmp_path, path)
+        except BaseException:
+            shutil.rmtree(entry, ignore_errors=True)
+            raise
+        os.utime(entry)
+        return path
+
+    def evict(self, room=0):
+        """Delete the least recently used entries until `room` more bytes fit under max_bytes."""
+        if not os.path.isdir(self.root):
+            return
+        entries = []
+        for name in os.listdir(self.root):
+            entry = os.path.join(self.root, name)
+            size = sum(f.stat().st_size for f in os.scandir(entry) if f.is_file())
+            entries.append((os.stat(entry).st_mtime, size, entry))
+        total = sum(size for _, size, _ in entries)
+        for _, size, entry in sorted(entries):
+            if total + room <= self.max_bytes:
+                break
+            shutil.rmtree(entry, ignore_errors=True)
+            total -= size
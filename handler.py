@@ -1,20 +1,42 @@
 import boto3
 import json
 import os
+import re
 import time
 from json.decoder import JSONDecodeError
 from datetime import datetime
-from parsons.etl import Table
-from selenium import webdriver
-from selenium.common.exceptions import TimeoutException
 from urllib.parse import unquote_plus
-from upload import ABUploader
+from scheduler import get_scheduler
+from store import get_store
+import metrics
+import throughput
 
-s3_client = boto3.client('s3')
+# Every Lambda in serverless.yml loads this module, so anything heavy (selenium,
+# yaml, chardet) is imported inside the functions that use it. Cold starts of
+# the lease, notify and bookkeeping functions then only pay for boto3.
+_clients = {}
+
+
+def aws(service):
+    # Created on first use, then reused by warm invocations
+    if service not in _clients:
+        _clients[service] = boto3.client(service)
+    return _clients[service]
+
+
+# Upload status polling bounds, in seconds
+MIN_WAIT = 15
+MAX_WAIT = 300
+MIN_POLL_BUDGET = 15 * 60
+# First poll at this fraction of the expected duration, so early finishes are seen early
+FIRST_POLL = 0.7
+# start_upload checkpoints outlive any retry of it, and are deleted once the upload is Complete
+CHECKPOINT_TTL = 2 * 24 * 60 * 60
 
 
 # See https://github.com/vittorio-nardone/selenium-chromium-lambda
 def chrome_options():
+    from selenium import webdriver
     chrome_options = webdriver.ChromeOptions()
 
     lambda_options = [
@@ -70,18 +92,46 @@ def chrome_options():
     return chrome_options
 
 
+# Chrome survives between invocations of a warm container
+drivers = None
+
+
+def get_drivers():
+    global drivers
+    if drivers is None:
+        from browser import DriverManager
+        drivers = DriverManager(chrome_options)
+    return drivers
+
+
+# Files downloaded to /tmp, kept for retries and later uploads in a warm container
+file_cache = None
+
+
+def get_file_cache():
+    global file_cache
+    if file_cache is None:
+        from filecache import FileCache
+        file_cache = FileCache(aws('s3'))
+    return file_cache
+
+
 def test():
+    from selenium import webdriver
     driver = webdriver.Chrome(options=chrome_options())
     driver.get('http://aflcio.org')
     print(driver.title)
 
 
+@metrics.entry_point
 def s3_handler(event, context):
+    from stream import data_name
     record = event['Records'][0]
     bucket = record['s3']['bucket']['name']
     file_key = unquote_plus(record['s3']['object']['key'])
-    file_type = file_key[-3:]
     print('Received file: %s' % file_key)
+    # .gz and .zip files are handled by what they contain
+    file_type = data_name(aws('s3'), bucket, file_key)[-3:].lower()
     if file_type == 'txt':
         handle_txt(bucket, file_key)
     if file_type == 'csv':
@@ -93,178 +143,497 @@ def s3_handler(event, context):
 
 
 def handle_txt(bucket, file_key):
-    txt_path = '/tmp/%s' % file_key
-    s3_client.download_file(bucket, file_key, txt_path)
+    from stream import S3Writer, convert_txt, open_s3
+    csv_key = re.sub(r'(\.txt)?(\.gz|\.zip)?$', '', file_key) + '.csv'
+    # Stream straight from S3 to S3 (decompressing on the way) so large files never touch /tmp
+    txt_body = open_s3(aws('s3'), bucket, file_key)
     try:
-        csv_path = ABUploader.txt_to_csv(txt_path)
-        s3_client.upload_file(csv_path, bucket, file_key.replace('.txt', '.csv'))
+        with S3Writer(aws('s3'), bucket, csv_key) as out_csv:
+            convert_txt(txt_body, out_csv)
     except:
         print('Failed to convert file: %s' % file_key)
         raise
 
 
 def handle_csv(bucket, file_key):
-    sfn_client = boto3.client('stepfunctions')
+    import coalesce
+    import configs
     campaign_key = file_key.split('_')[0]
-    # Read config file
-    s3_client.download_file(bucket, 'config.yml', '/tmp/config.yml')
-    config = ABUploader.parse_config('/tmp/config.yml', campaign_key)
-    uploads = list(config['field_map'])
-    uploads.remove('id')
+    # Only downloaded and parsed again when config.yml changes
+    config = configs.get_campaign(aws('s3'), get_store('configs'), bucket, campaign_key)
     execution_name = '%s_%s' % (campaign_key, int(time.time()))
-    file_info = get_file_info(file_key, bucket)
+    metrics.set_context(instance=config['instance'], campaign=campaign_key, execution=execution_name)
+    window = config.get('coalesce_window')
+    if window:
+        # Files landing within the window are merged and uploaded by one execution
+        execution_name, opened = coalesce.add_file(
+            coalesce.get_backend(), coalesce.batch_key(config['instance'], campaign_key),
+            file_key, execution_name, window)
+        if not opened:
+            print('Added %s to batch %s' % (file_key, execution_name))
+            return
+        print('Collecting files for %s for %ds' % (campaign_key, window))
+        start_execution({
+            "execution_name": execution_name,
+            "config": configs.compact(config),
+            "bucket": bucket,
+            "campaign_key": campaign_key,
+            "file_key": file_key,
+            "coalesce": {"window": window},
+        })
+        return
+    with metrics.span('prepare_job') as span:
+        job = prepare_job(bucket, file_key, campaign_key, config, execution_name)
+        if job:
+            span.update(rows=job['total_rows'], chunks=len(job['chunk_jobs']))
+    if job:
+        start_execution(job)
+
+
+def prepare_job(bucket, file_key, campaign_key, config, execution_name):
+    """Validate and split a file, returning the state machine's input (or None if there's nothing to upload)."""
+    import configs
+    import delta
+    from stream import S3Writer, data_size
+    from campaigns import DataError
+    from validate import Validator
+    uploads = list(config['columns'])
+    # Pick the chunk size from how fast similar uploads went, if we've seen enough of them
+    head = aws('s3').head_object(Bucket=bucket, Key=file_key)
+    file_bytes = data_size(aws('s3'), bucket, file_key, head['ContentLength'])
+    history = get_store('throughput').get(throughput.history_key(config['instance'], campaign_key))
+    chunk_size = throughput.choose_chunk_size(
+        history, file_bytes, uploads, config['concurrency']['chunks'], config['chunk_size'])
+    print('Using chunk size %d' % chunk_size)
+    job_delta = None
+    file_info = None
+    validator = None
+    if config['validation'] != 'off':
+        # Reports go next to the file, as <file_key>.errors and <file_key>.quarantine
+        validator = Validator(
+            config['field_map'], uploads, config['validation'],
+            lambda name: S3Writer(aws('s3'), bucket, '%s.%s' % (file_key, name)), columns=config['columns'])
+    try:
+        if config.get('delta'):
+            # Upload with `aws s3 cp --metadata full-refresh=true` to send every row once
+            full_refresh = config.get('full_refresh') or head['Metadata'].get('full-refresh') in ('true', '1', 'yes')
+            file_info, job_delta = get_delta_info(
+                file_key, bucket, chunk_size, config, campaign_key, uploads, execution_name, full_refresh, validator)
+        else:
+            file_info = get_file_info(file_key, bucket, chunk_size, config['columns'], validator)
+        if validator:
+            validator.close()
+            if validator.bad_rows:
+                print(validator.summary())
+                if validator.mode == 'reject':
+                    raise DataError(validator.summary())
+    except DataError as e:
+        # Fail before any upload starts, and tell whoever sent the file why
+        if job_delta:
+            delta.discard_index(aws('s3'), job_delta['bucket'], job_delta['pending'])
+        if file_info:
+            # Chunks are written as the file is read, before we know it's rejected
+            delete_files(bucket, file_info['files'])
+        report = '%s.errors' % file_key if validator and validator.bad_rows else None
+        reject_file(bucket, file_key, config, execution_name, e, report)
+        return None
 
     # Skip files with no records
     if file_info['rows'] == 0:
         print('No records in file %s' % file_key)
-        return
-
-    # Split csv if needed
-    chunks = split_csv(file_info)
+        if job_delta:
+            delta.discard_index(aws('s3'), job_delta['bucket'], job_delta['pending'])
+        return None
+    files = file_info['files']
+    if not files:
+        print('No changes in file %s' % file_key)
+        delta.discard_index(aws('s3'), job_delta['bucket'], job_delta['pending'])
+        return None
+
+    # Files were written while counting rows, split in chunks if the file was big enough
+    chunks = len(files) if len(files) > 1 else False
     if chunks:
         print('Splitting file in %d chunks' % chunks)
-        uploads = ['%s_%d' % (u, c)  for c in range(chunks) for u in uploads]
-    # Start state machine
+    chunk_jobs = []
+    for c, chunk_files in enumerate(files):
+        names = {u: '%s_%d' % (u, c) if chunks else u for u in uploads if u in chunk_files}
+        chunk_jobs.append({
+            "chunk": c if chunks else None,
+            "uploads_todo": list(names.values()),
+            "files": {names[u]: chunk_files[u] for u in names},
+        })
+    # Start state machine; chunks run in parallel, each in upload order
+    all_uploads = [u for job in chunk_jobs for u in job['uploads_todo']]
+    job = {
+        "execution_name": execution_name,
+        # Just the settings and config version; Lambdas that need the field map look it up
+        "config": configs.compact(config),
+        "bucket": bucket,
+        "campaign_key": campaign_key,
+        "file_key": file_key,
+        "chunk_jobs": chunk_jobs,
+        "upload_status": dict.fromkeys(all_uploads, ''),
+        "chunks": chunks,
+        "chunk_size": chunk_size,
+        "total_rows": file_info['rows'],
+        # Of the dropped file, so throughput history can estimate rows from the next file's size
+        "source_bytes_per_row": file_bytes / file_info['rows'],
+    }
+    if job_delta:
+        job['delta'] = job_delta
+    return job
+
+
+def start_execution(job):
+    sfn_client = aws('stepfunctions')
     sfn_client.start_execution(
         stateMachineArn=os.getenv('stateMachineArn'),
-        name=execution_name,
-        input=json.dumps({
-            "execution_name": execution_name,
-            "config": {
-                **config,
-            },
-            "bucket": bucket,
-            "campaign_key": campaign_key,
-            "file_key": file_key,
-            "uploads_todo": uploads,
-            "upload_status": dict.fromkeys(uploads, ''),
-            "chunks": chunks,
-            "total_rows": file_info['rows'],
-        })
+        name=job['execution_name'],
+        input=json.dumps(job)
     )
 
 
-def get_file_info(file_key, bucket=None):
-    csv = read_csv(file_key, bucket)
+@metrics.entry_point
+def coalesce_files(event, context):
+    import coalesce
+    import configs
+    # The batch's window is over: merge its files into one and prepare the job as handle_csv would
+    config = configs.resolve(event['config'], get_store('configs'))
+    files = coalesce.close_batch(
+        coalesce.get_backend(), coalesce.batch_key(config['instance'], event['campaign_key']),
+        event['execution_name'])
+    job = None
+    if files:
+        print('Merging %d files: %s' % (len(files), ', '.join(files)))
+        merged_key = '%s.merged' % event['execution_name']
+        with metrics.span('merge_files', files=len(files)) as span:
+            rows = span['rows'] = coalesce.merge_csv(
+                aws('s3'), event['bucket'], files, merged_key, config['field_map']['id']['column'])
+        print('Merged %d rows' % rows)
+        with metrics.span('prepare_job') as span:
+            job = prepare_job(event['bucket'], merged_key, event['campaign_key'], config, event['execution_name'])
+            if job:
+                span.update(rows=job['total_rows'], chunks=len(job['chunk_jobs']))
+    if not job:
+        # Nothing to upload, so the execution ends here
+        return {**event, "skip": True, "chunk_jobs": [], "upload_status": {}}
+    job['coalesced_files'] = files
+    return job
+
+
+def delete_files(bucket, files):
+    """Delete the chunk objects of a job's files ({upload_type: key} per chunk)."""
+    keys = [key for chunk_files in files for key in chunk_files.values()]
+    # delete_objects takes up to 1000 keys at a time
+    for i in range(0, len(keys), 1000):
+        aws('s3').delete_objects(Bucket=bucket, Delete={
+            "Objects": [{"Key": key} for key in keys[i:i + 1000]],
+            "Quiet": True,
+        })
+
+
+def get_file_info(file_key, bucket, chunk_size=5000, columns=None, validator=None):
+    from stream import open_s3, split_csv
+    # One streaming pass counts the rows and writes each upload type's columns (see compile_fields) in chunks
+    body = open_s3(aws('s3'), bucket, file_key)
+    rows, files = split_csv(body, aws('s3'), bucket, file_key, chunk_size, columns, validator)
     return {
         "file_key": file_key,
         "bucket": bucket,
-        "rows": csv.num_rows,
-        "csv": csv
+        "rows": rows,
+        "files": files,
     }
 
-def split_csv(file_info, chunk_size=5000):
-    if file_info['rows'] < chunk_size:
-        return False
-    for index, chunk in enumerate(file_info['csv'].chunk(chunk_size)):
-        filename = '%s.%s' % (file_info['file_key'], index)
-        write_csv(chunk, filename, file_info['bucket'])
-    return index + 1 # (number of chunks)
-
-
-def read_csv(file, bucket=None):
-    if bucket:
-        return Table.from_s3_csv(bucket, file)
-    else:
-        return Table.from_csv(file)
-
-def write_csv(list, filename, bucket=None):
-    if bucket:
-        list.to_s3_csv(bucket, filename)
-    else:
-        list.to_csv(filename)
-
 
-def one_ata_time(event, context):
-    sfn_client = boto3.client('stepfunctions')
-    executions = sfn_client.list_executions(
-        stateMachineArn=os.getenv('stateMachineArn'),
-        statusFilter='RUNNING'
-    )['executions']
-    oldest = executions[-1]['name']
-    if event['execution_name'] == oldest:
-        print('%s GO!' % event['campaign_key'])
-        event['proceed'] = True
-    else:
-        print('%s waiting' % event['campaign_key'])
-        event['proceed'] = False
-    return event
+def get_delta_info(file_key, bucket, chunk_size, config, campaign_key, uploads, execution_name, full_refresh,
+                   validator=None):
+    import delta
+    from stream import open_s3
+    # One streaming pass writes each upload type's changed rows and the next fingerprint index
+    state_bucket = os.getenv('STATE_BUCKET') or bucket
+    index_key = delta.index_key(config['instance'], campaign_key)
+    old_index, base_etag = delta.load_index(aws('s3'), state_bucket, index_key)
+    body = open_s3(aws('s3'), bucket, file_key)
+    rows, changed, files, index = delta.split_changes(
+        body, aws('s3'), bucket, file_key, chunk_size, config['field_map'], uploads, old_index, full_refresh,
+        validator, config['columns'])
+    print('%d of %d rows to upload%s' % (changed, rows, ' (full refresh)' if full_refresh else ''))
+    # Committed by collect_chunks once every upload is Complete
+    pending = delta.pending_key(config['instance'], campaign_key, execution_name)
+    delta.save_index(aws('s3'), state_bucket, pending, index)
+    file_info = {
+        "file_key": file_key,
+        "bucket": bucket,
+        "rows": rows,
+        "files": files,
+    }
+    return file_info, {"bucket": state_bucket, "key": index_key, "pending": pending, "base_etag": base_etag}
 
 
+def reject_file(bucket, file_key, config, execution_name, error, report=None):
+    msg_params = {
+        "campaign": config['campaign_name'],
+        "file": file_key,
+        "instance": config['instance'],
+        "execution": execution_name,
+        "error": 'DataError',
+        "errorDetails": str(error) + ('\nFull report: s3://%s/%s' % (bucket, report) if report else ''),
+        "uploadStatus": '',
+        "text": "The file failed validation, so nothing was uploaded.",
+    }
+    send_notification("[ABUploader] JOB REJECTED", msg_params)
+
+
+@metrics.entry_point
+def acquire_lease(event, context):
+    # Called with a task token; the execution waits until wake() sends it back
+    job = event['job']
+    scheduler = get_scheduler()
+    granted = scheduler.acquire(
+        job['config']['instance'], job['execution_name'], job['campaign_key'],
+        job['config']['concurrency'], event['token'])
+    if not any(g['holder'] == job['execution_name'] for g in granted):
+        print('%s waiting' % job['campaign_key'])
+    wake(scheduler, job['config']['instance'], granted)
+
+
+@metrics.entry_point
+def release_lease(event, context):
+    import delta
+    # Step Functions status change event for a finished execution
+    job = json.loads(event['detail']['input'])
+    metrics.set_context(**metrics.job_fields(job))
+    scheduler = get_scheduler()
+    instance = job['config']['instance']
+    print('%s released' % job['campaign_key'])
+    if job['config'].get('delta') and event['detail']['status'] != 'SUCCEEDED':
+        # Coalesced executions only get their delta state after starting, so find it by name
+        delta.discard_index(
+            aws('s3'), os.getenv('STATE_BUCKET') or job['bucket'],
+            delta.pending_key(instance, job['campaign_key'], job['execution_name']))
+    wake(scheduler, instance, scheduler.release(instance, job['execution_name']))
+
+
+@metrics.entry_point
+def sweep_leases(event, context):
+    scheduler = get_scheduler()
+    for instance, granted in scheduler.sweep().items():
+        wake(scheduler, instance, granted)
+
+
+def renew_lease(event):
+    """Keep the execution's lease from expiring while its uploads are still running."""
+    try:
+        if not get_scheduler().renew(event['config']['instance'], event['execution_name']):
+            print('No lease to renew for %s' % event['execution_name'])
+    except Exception as e:
+        # The lease only bounds concurrency, so don't fail the upload over it
+        print('Could not renew lease for %s: %s' % (event['execution_name'], e))
+
+
+def wake(scheduler, instance, granted):
+    sfn_client = aws('stepfunctions')
+    for waiter in granted:
+        try:
+            sfn_client.send_task_success(
+                taskToken=waiter['token'],
+                output=json.dumps({"holder": waiter['holder'], "granted_at": time.time()}))
+            print('%s GO!' % waiter['campaign'])
+            # Time the execution sat in the Step Functions task waiting for its turn
+            metrics.emit('lease_wait', time.time() - waiter['queued_at'],
+                         instance=instance, campaign=waiter['campaign'], execution=waiter['holder'])
+        except (sfn_client.exceptions.TaskTimedOut, sfn_client.exceptions.TaskDoesNotExist,
+                sfn_client.exceptions.InvalidToken):
+            # That execution is gone, so pass its slot on
+            wake(scheduler, instance, scheduler.release(instance, waiter['holder']))
+
+
+@metrics.entry_point
 def start_upload(event, context):
+    import configs
+    from stream import csv_stats
+    config = configs.resolve(event['config'], get_store('configs'))
+    renew_lease(event)
     event['current_upload'] = event['uploads_todo'].pop(0)
     # If upload type ends with _N, we're dealing with a chunk
     upload_type = event['current_upload']
     chunk = upload_type.rsplit('_')[1] if '_' in upload_type else False
-    file_key = event['file_key'] if not chunk else '%s.%s' % (event['file_key'], chunk)
+    # handle_csv recorded which file (whole, chunk, or changed rows) each upload sends
+    file_key = event['files'][event['current_upload']]
     upload_type = upload_type if not chunk else upload_type.rsplit('_')[0]
-    # Retrieve file to upload
-    file_path = '/tmp/%s' % file_key
-    s3_client.download_file(
-        event['bucket'],
-        file_key,
-        file_path
-    )
-
-    uploader = ABUploader(config=event['config'],
-                          upload_file=file_path,
-                          chrome_options=chrome_options())
-    print('---Starting Upload: %s - %s---' %
-          (event['campaign_key'], event['current_upload']))
-    event['upload_name'] = uploader.start_upload(upload_type)
-    event['wait_time'] = 30
+    # What an earlier attempt at this upload got through, if Step Functions is retrying it
+    checkpoints = get_store('checkpoints')
+    key = checkpoint_key(event)
+    checkpoint = checkpoints.get(key) or {}
+
+    def save_checkpoint(stage, **fields):
+        checkpoint.update(fields, stage=stage)
+        checkpoints.put(key, checkpoint, ttl=CHECKPOINT_TTL)
+
+    # Only the wizard needs selenium, so API uploads don't load it
+    if config.get('engine') == 'api':
+        from api import APIUploader
+        uploader = APIUploader(config=config,
+                               session_store=get_store('sessions'),
+                               checkpoint=save_checkpoint)
+    else:
+        from upload import ABUploader
+        uploader = ABUploader(config=config,
+                              driver_factory=get_drivers().get,
+                              session_store=get_store('sessions'),
+                              checkpoint=save_checkpoint)
+    metrics.set_context(**metrics.upload_fields(event['current_upload']))
+    upload_name = submitted_upload(uploader, checkpoint, file_key)
+    if upload_name:
+        # Already with Action Builder, so skip the wizard and go back to polling
+        print('---Resuming Upload: %s - %s (%s)---' % (event['campaign_key'], event['current_upload'], upload_name))
+        event['started_at'] = checkpoint['started_at']
+        event['upload_stats'] = checkpoint['upload_stats']
+        event['upload_name'] = upload_name
+        save_checkpoint('submitted', upload_name=upload_name)
+    else:
+        # Retrieve file to upload, unless this container already has this version of it
+        with metrics.span('download'):
+            file_path = get_file_cache().get(event['bucket'], file_key)
+        uploader.UPLOAD_FILE = file_path
+        print('---Starting Upload: %s - %s---' %
+              (event['campaign_key'], event['current_upload']))
+        event['started_at'] = time.time()
+        event['upload_stats'] = csv_stats(file_path)
+        save_checkpoint('started', started_at=event['started_at'], upload_stats=event['upload_stats'])
+        metrics.set_context(rows=event['upload_stats']['rows'], columns=event['upload_stats']['columns'])
+        event['upload_name'] = uploader.start_upload(upload_type)
+    history = get_store('throughput').get(throughput.history_key(event['config']['instance'], event['campaign_key']))
+    eta = throughput.predict_seconds(history, upload_type, event['upload_stats']['rows'])
+    # Latest time the upload was known not to be Complete
+    event['pending_at'] = time.time()
+    if eta:
+        # First poll lands a bit before similar uploads have finished; give up after 3x that
+        event['eta'] = event['started_at'] + eta
+        event['deadline'] = event['started_at'] + max(3 * eta, MIN_POLL_BUDGET)
+        event['wait_time'] = max(int(event['started_at'] + FIRST_POLL * eta - time.time()), MIN_WAIT)
+        print('Expecting upload to finish in %ds' % (event['eta'] - time.time()))
+    else:
+        event['wait_time'] = 30
     return event
 
 
+def checkpoint_key(event):
+    return '%s/%s/%s' % (event['config']['instance'], event['execution_name'], event['current_upload'])
+
+
+def submitted_upload(uploader, checkpoint, file_key):
+    """Name of the upload an earlier attempt submitted, or None if the wizard has to run (again)."""
+    if checkpoint.get('stage') == 'submitted':
+        return checkpoint['upload_name']
+    if checkpoint.get('stage') == 'mapped':
+        # It may have submitted before it could record that, so ask Action Builder
+        upload_name = uploader.find_upload(
+            os.path.basename(file_key), checkpoint.get('upload_name'), checkpoint.get('started_at'))
+        if upload_name:
+            print('Found upload %s from an earlier attempt' % upload_name)
+        return upload_name
+    return None
+
+
+@metrics.entry_point
 def check_upload_status(event, context):
+    import configs
+    from upload import ABUploader
     # Get status of upload
     uploader = ABUploader(
-        config=event['config'], upload_name=event['upload_name'], chrome_options=chrome_options())
+        config=configs.resolve(event['config'], get_store('configs')), upload_name=event['upload_name'],
+        driver_factory=get_drivers().get, session_store=get_store('sessions'), snapshot_store=get_store('upload-lists'))
     status = uploader.get_upload_status()
+    renew_lease(event)
     current = event['current_upload']
     event['upload_status'][current] = status
     event['current_status'] = status
     event['next_move'] = 'keep_waiting'
+    if 'eta' in event:
+        # Poll again at the expected finish, then often just after it, backing off the later it gets
+        now = time.time()
+        overdue = now - event['eta']
+        if overdue < 0:
+            event['wait_time'] = max(int(-overdue), MIN_WAIT)
+        else:
+            event['wait_time'] = int(min(max(overdue / 2, MIN_WAIT), MAX_WAIT))
+        event['retries_left'] = int((event['deadline'] - now) // event['wait_time'])
     # Exponential backoff (max 62 minutes)
-    if 'retries_left' not in event:
+    elif 'retries_left' not in event:
         event['retries_left'] = 14
         event['wait_time'] = 60
     else:
         event['retries_left'] -= 1
-        event['wait_time'] = min(event['wait_time'] * 2, 300)
+        event['wait_time'] = min(event['wait_time'] * 2, MAX_WAIT)
     # Upload is done
     if 'Complete' in status:
         print('---Upload Complete: %s - %s---' % (event['campaign_key'], current))
+        # It finished between the last check that didn't see Complete and this one, so take the
+        # midpoint: timing it by this check would only ever grow the predictions polls are timed by
+        finished_at = (event.get('pending_at', event['started_at']) + time.time()) / 2
+        metrics.emit('upload_processing', finished_at - event['started_at'])
+        stats = event['upload_stats']
+        throughput.record_upload(
+            get_store('throughput'), throughput.history_key(event['config']['instance'], event['campaign_key']),
+            current.rsplit('_')[0], stats['rows'], stats['columns'], stats['bytes'],
+            finished_at - event['started_at'], event.get('source_bytes_per_row'))
+        get_store('checkpoints').delete(checkpoint_key(event))
         # Cleanup our state variables before next upload
-        del event['wait_time'], event['retries_left']
+        del event['wait_time'], event['retries_left'], event['started_at'], event['upload_stats']
+        for key in ['eta', 'deadline', 'pending_at']:
+            event.pop(key, None)
         del event['current_status'], event['current_upload'], event['upload_name']
         event['next_move'] = 'next_upload'
         if not len(event['uploads_todo']):
             del event['uploads_todo']
             event['next_move'] = 'all_done'
+    else:
+        event['pending_at'] = time.time()
     # Upload failed
     if 'Failure' in status:
         raise Exception('Upload failed')
     return event
 
 
+@metrics.entry_point
+def collect_chunks(event, context):
+    import delta
+    # Fold each chunk's statuses back into the job, as if they had run in sequence
+    for chunk_status in event.pop('chunk_results'):
+        event['upload_status'].update(chunk_status)
+    del event['chunk_jobs']
+    # Every upload is Complete, so the rows they sent can count as uploaded
+    if 'delta' in event:
+        job_delta = event['delta']
+        delta.commit_index(
+            aws('s3'), job_delta['bucket'], job_delta['key'], job_delta['pending'], job_delta['base_etag'])
+    return event
+
+
+@metrics.entry_point
 def notify(event, context):
     if 'detail' in event:
-        job_info = get_job_info(event['detail']['executionArn'])
         status = event['detail']['status']
+        job_info = get_job_info(event['detail']['executionArn'], status)
+        metrics.set_context(**metrics.job_fields(job_info))
     else:
         job_info = event
         status = 'STARTED'
+    if job_info.get('skip'):
+        # Coalesced batch with nothing to upload
+        return event
 
     subject = "[ABUploader] JOB %s" % status
     msg_params = {
         "campaign": job_info['config']['campaign_name'],
-        "file": job_info['file_key'],
+        "file": ', '.join(job_info.get('coalesced_files') or [job_info['file_key']]),
         "instance": job_info['config']['instance'],
         "execution": job_info['execution_name'],
         "error": None,
         "errorDetails": None,
-        "uploadStatus": "\n".join("%s:\t%s" % (u, s) for u, s in job_info['upload_status'].items()),
+        # Coalesced executions that failed before the job was prepared have no statuses yet
+        "uploadStatus": "\n".join("%s:\t%s" % (u, s) for u, s in job_info.get('upload_status', {}).items()),
     }
 
     if status == 'STARTED':
@@ -279,20 +648,29 @@ def notify(event, context):
     return event
 
 
-def get_job_info(exec_arn):
-    sfn_client = boto3.client('stepfunctions')
+def get_job_info(exec_arn, status):
+    sfn_client = aws('stepfunctions')
+    if status == 'SUCCEEDED':
+        # Output is the whole job, with every chunk's statuses already collected
+        return json.loads(sfn_client.describe_execution(executionArn=exec_arn)['output'])
     result = sfn_client.get_execution_history(
         executionArn=exec_arn,
-        maxResults=5,
+        maxResults=25,
         reverseOrder=True
     )
     details = [v for e in result['events'] for v in e.values() if isinstance(v, dict)]
-    info = next(v for d in details for k,v in d.items() if k == 'output' or k == 'input')
-    return json.loads(info)
+    infos = [json.loads(v) for d in details for k,v in d.items() if k == 'output' or k == 'input']
+    # Failed runs have no output, so take the whole job from the history and
+    # fill in the latest statuses of the chunks that got that far
+    info = next((i for i in infos if 'chunk_jobs' in i), infos[0])
+    for chunk_info in reversed(infos):
+        if 'chunk' in chunk_info and 'upload_status' in chunk_info:
+            info['upload_status'].update(chunk_info['upload_status'])
+    return info
 
 
 def get_errors(msg_params, exec_arn):
-    sfn_client = boto3.client('stepfunctions')
+    sfn_client = aws('stepfunctions')
     result = sfn_client.get_execution_history(
         executionArn=exec_arn,
         maxResults=1,
@@ -311,7 +689,7 @@ def get_errors(msg_params, exec_arn):
 
 
 def send_notification(subject, msg_params):
-    sns_client = boto3.client('sns')
+    sns_client = aws('sns')
     msg = """{text}
 --------------------------------------------------------------------------------
 Job Details
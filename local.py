@@ -1,13 +1,15 @@
 from dotenv import load_dotenv
+from campaigns import parse_config
 from upload import ABUploader
+from store import get_store
 
 load_dotenv()
 # Change these variables.
 upload_file = '/Users/jmann/Desktop/AB Data/Sample:Demo/auto-upload-test_20200722.csv'
 config_file = 'config.example.yml'
 campaign_key = 'upload-test'
-config = ABUploader.parse_config(config_file, campaign_key)
-uploader = ABUploader(config, upload_file)
+config = parse_config(config_file, campaign_key)
+uploader = ABUploader(config, upload_file, session_store=get_store('sessions'))
 uploader.start_upload('people')
 uploader.finish_upload()
 uploader.start_upload('info')
@@ -0,0 +1,81 @@
+import functools
+import json
+import os
+import time
+from contextlib import contextmanager
+
+# Records are printed in CloudWatch embedded metric format, so Lambda's logs
+# turn them into metrics with no extra calls. dev/metrics_report.py reads them
+# back out of the logs for percentile breakdowns.
+NAMESPACE = os.getenv('METRICS_NAMESPACE', 'ABUploader')
+# Each set becomes a CloudWatch dimension set when the record has all of its fields
+DIMENSIONS = [['phase'], ['phase', 'instance'], ['phase', 'upload_type']]
+
+# Fields added to every record: instance, campaign, upload type, chunk, rows, columns...
+_context = {}
+
+
+def set_context(**fields):
+    """Add fields to every following record. A field set to None is dropped."""
+    _context.update(fields)
+
+
+def job_fields(event):
+    """Context fields from a Step Functions job (or a lease call wrapping one)."""
+    job = event.get('job', event) if isinstance(event, dict) else {}
+    config = job.get('config') or {}
+    fields = {
+        "instance": config.get('instance'),
+        "campaign": job.get('campaign_key'),
+        "execution": job.get('execution_name'),
+        "chunk": job.get('chunk'),
+    }
+    if job.get('current_upload'):
+        fields.update(upload_fields(job['current_upload']))
+    if job.get('upload_stats'):
+        fields.update(rows=job['upload_stats']['rows'], columns=job['upload_stats']['columns'])
+    return fields
+
+
+def upload_fields(upload):
+    # Chunked uploads are named <upload type>_<chunk>
+    upload_type, _, chunk = upload.partition('_')
+    return {"upload_type": upload_type, "chunk": int(chunk) if chunk else None}
+
+
+def emit(phase, seconds, **fields):
+    record = {k: v for k, v in {**_context, **fields}.items() if v is not None}
+    record.update(phase=phase, seconds=round(seconds, 3))
+    record['_aws'] = {
+        "Timestamp": int(time.time() * 1000),
+        "CloudWatchMetrics": [{
+            "Namespace": NAMESPACE,
+            "Dimensions": [d for d in DIMENSIONS if all(isinstance(record.get(k), str) for k in d)],
+            "Metrics": [{"Name": 'seconds', "Unit": 'Seconds'}],
+        }],
+    }
+    print(json.dumps(record))
+
+
+@contextmanager
+def span(phase, **fields):
+    """Time the block and emit it as `phase`. Fields set on the yielded dict are added to the record."""
+    start = time.perf_counter()
+    try:
+        yield fields
+    except BaseException as e:
+        fields['error'] = type(e).__name__
+        raise
+    finally:
+        emit(phase, time.perf_counter() - start, **fields)
+
+
+def entry_point(func):
+    """Span a Lambda handler, taking context from its event. Context is reset for each invocation."""
+    @functools.wraps(func)
+    def wrapper(event, context):
+        _context.clear()
+        set_context(**job_fields(event))
+        with span('handler.%s' % func.__name__):
+            return func(event, context)
+    return wrapper
@@ -0,0 +1,161 @@
+import json
+import os
+import threading
+import time
+
+# Leases not released or renewed within this many seconds are treated as crashed and dropped
+LEASE_TTL = int(os.getenv('LEASE_TTL', 3 * 60 * 60))
+
+
+class LeaseScheduler:
+    """Per-instance and per-campaign concurrency limits with a FIFO wait queue.
+
+    Each Action Builder instance has one document holding its current lease
+    holders and the executions queued behind them. Every change goes through
+    the backend's atomic update, so concurrent Lambdas never over-grant.
+    acquire() and release() return the queued waiters that were just granted
+    a lease, so the caller can wake them.
+    """
+
+    def __init__(self, backend, lease_ttl=LEASE_TTL):
+        self.backend = backend
+        self.lease_ttl = lease_ttl
+
+    def acquire(self, instance, holder, campaign, limits, token=None):
+        granted = []
+
+        def enqueue(doc):
+            granted.clear()
+            if holder not in doc['holders'] and not any(w['holder'] == holder for w in doc['queue']):
+                doc['queue'].append({
+                    "holder": holder,
+                    "campaign": campaign,
+                    "limits": limits,
+                    "token": token,
+                    "queued_at": time.time(),
+                })
+            granted.extend(self.grant(doc))
+            return doc
+
+        self.backend.update(instance, enqueue)
+        return granted
+
+    def release(self, instance, holder):
+        granted = []
+
+        def remove(doc):
+            granted.clear()
+            doc['holders'].pop(holder, None)
+            doc['queue'] = [w for w in doc['queue'] if w['holder'] != holder]
+            granted.extend(self.grant(doc))
+            return doc
+
+        self.backend.update(instance, remove)
+        return granted
+
+    def renew(self, instance, holder):
+        """Push back a running holder's expiry. Returns False if it no longer holds a lease."""
+        renewed = []
+
+        def extend(doc):
+            renewed.clear()
+            if holder in doc['holders']:
+                doc['holders'][holder]['expires_at'] = time.time() + self.lease_ttl
+                renewed.append(holder)
+            return doc
+
+        self.backend.update(instance, extend)
+        return bool(renewed)
+
+    def sweep(self):
+        """Drop expired leases everywhere and grant whatever that frees up."""
+        granted = {}
+        for instance in self.backend.keys():
+            granted[instance] = self.release(instance, None)
+        return granted
+
+    def grant(self, doc):
+        """Hand out free slots to queued waiters, oldest first."""
+        now = time.time()
+        doc['holders'] = {h: l for h, l in doc['holders'].items() if l['expires_at'] > now}
+        granted = []
+        waiting = []
+        for waiter in doc['queue']:
+            limits = waiter['limits']
+            running = list(doc['holders'].values())
+            same_campaign = [l for l in running if l['campaign'] == waiter['campaign']]
+            if len(running) >= limits.get('instance', 1):
+                waiting.append(waiter)
+                continue
+            if len(same_campaign) >= limits.get('campaign', 1):
+                # Blocked by its own campaign only, so later campaigns may go ahead
+                waiting.append(waiter)
+                continue
+            doc['holders'][waiter['holder']] = {
+                "campaign": waiter['campaign'],
+                "expires_at": now + self.lease_ttl,
+            }
+            granted.append(waiter)
+        doc['queue'] = waiting
+        return granted
+
+
+class LocalBackend:
+    """In-memory stand-in for DynamoBackend, for local runs and checks."""
+
+    def __init__(self, empty=None):
+        self.docs = {}
+        self.lock = threading.Lock()
+        self.empty = empty or empty_doc
+
+    def update(self, key, fn):
+        with self.lock:
+            doc = json.loads(self.docs.get(key, json.dumps(self.empty())))
+            self.docs[key] = json.dumps(fn(doc))
+
+    def keys(self):
+        return list(self.docs)
+
+
+class DynamoBackend:
+    """One item per key, updated with optimistic concurrency on a version number.
+
+    `empty` builds the document for keys that don't have one yet (a lease
+    document by default).
+    """
+
+    def __init__(self, table_name, empty=None):
+        import boto3
+        self.table = boto3.resource('dynamodb').Table(table_name)
+        self.empty = empty or empty_doc
+
+    def update(self, key, fn, attempts=10):
+        from botocore.exceptions import ClientError
+        for _ in range(attempts):
+            item = self.table.get_item(Key={'pk': key}, ConsistentRead=True).get('Item')
+            version = int(item['version']) if item else 0
+            doc = fn(json.loads(item['doc']) if item else self.empty())
+            try:
+                self.table.put_item(
+                    Item={'pk': key, 'doc': json.dumps(doc), 'version': version + 1},
+                    ConditionExpression='attribute_not_exists(pk) OR version = :version',
+                    ExpressionAttributeValues={':version': version})
+                return
+            except ClientError as e:
+                if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+                    raise
+        raise Exception('Could not update document %s' % key)
+
+    def keys(self):
+        items = self.table.scan(ProjectionExpression='pk')['Items']
+        return [i['pk'] for i in items]
+
+
+def empty_doc():
+    return {"holders": {}, "queue": []}
+
+
+def get_scheduler():
+    """DynamoDB when LEASE_TABLE is set (Lambda), otherwise the in-memory stand-in."""
+    table = os.getenv('LEASE_TABLE')
+    return LeaseScheduler(DynamoBackend(table) if table else LocalBackend())
@@ -0,0 +1,91 @@
+import json
+import os
+import time
+from json.decoder import JSONDecodeError
+
+
+class LocalStore:
+    """JSON documents kept as files in a local directory."""
+
+    def __init__(self, root):
+        self.root = root
+
+    def _path(self, key):
+        return os.path.join(self.root, '%s.json' % key)
+
+    def get(self, key):
+        try:
+            with open(self._path(key)) as file:
+                return unwrap(json.load(file))
+        except (FileNotFoundError, JSONDecodeError):
+            return None
+
+    def put(self, key, value, ttl=None):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write then rename so readers never see a partial document
+        tmp_path = '%s.%d.tmp' % (path, os.getpid())
+        with open(tmp_path, 'w') as file:
+            json.dump(wrap(value, ttl), file)
+        os.replace(tmp_path, path)
+
+    def delete(self, key):
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
+
+
+class S3Store:
+    """JSON documents kept as objects under a prefix of an S3 bucket."""
+
+    def __init__(self, bucket, prefix, s3_client=None):
+        import boto3
+        self.bucket = bucket
+        self.prefix = prefix
+        self.s3_client = s3_client or boto3.client('s3')
+
+    def _key(self, key):
+        return '%s/%s.json' % (self.prefix, key)
+
+    def get(self, key):
+        try:
+            body = self.s3_client.get_object(Bucket=self.bucket, Key=self._key(key))['Body']
+        except self.s3_client.exceptions.NoSuchKey:
+            return None
+        try:
+            return unwrap(json.loads(body.read()))
+        except JSONDecodeError:
+            return None
+
+    def put(self, key, value, ttl=None):
+        self.s3_client.put_object(
+            Bucket=self.bucket, Key=self._key(key), Body=json.dumps(wrap(value, ttl)).encode('utf-8'))
+
+    def delete(self, key):
+        self.s3_client.delete_object(Bucket=self.bucket, Key=self._key(key))
+
+
+def wrap(value, ttl=None):
+    return {
+        "value": value,
+        "expires_at": time.time() + ttl if ttl else None,
+    }
+
+
+def unwrap(document):
+    if document.get('expires_at') and document['expires_at'] < time.time():
+        return None
+    return document['value']
+
+
+def get_store(namespace):
+    """S3 when STATE_BUCKET is set (Lambda), otherwise a local directory.
+
+    Sessions hold logged-in Action Builder cookies, so STATE_BUCKET must be one
+    that whoever drops files into the uploads bucket can't read.
+    """
+    bucket = os.getenv('STATE_BUCKET')
+    if bucket:
+        return S3Store(bucket, '_state/%s' % namespace)
+    return LocalStore(os.path.join(os.getenv('STATE_DIR', '/tmp/ab-uploader'), namespace))
@@ -0,0 +1,357 @@
+import codecs
+import csv
+import gzip
+import io
+import os
+import zipfile
+from itertools import islice
+
+# Max bytes fed to the encoding detector before we settle on its best guess
+DETECT_BYTES = int(os.getenv('DETECT_BYTES', 1024 * 1024))
+BLOCK_SIZE = 64 * 1024
+ROW_BATCH = 1000
+# S3 multipart parts must be at least 5MB (except the last one)
+PART_SIZE = 8 * 1024 * 1024
+# Read buffer for archives read through S3RangeReader
+RANGE_BUFFER = 1024 * 1024
+
+
+def open_s3(s3_client, bucket, key):
+    """Binary stream of an S3 object's data, decompressing .gz and .zip files as it's read."""
+    if key.endswith('.zip'):
+        archive = zipfile.ZipFile(io.BufferedReader(S3RangeReader(s3_client, bucket, key), RANGE_BUFFER))
+        return archive.open(zip_member(archive))
+    body = s3_client.get_object(Bucket=bucket, Key=key)['Body']
+    if key.endswith('.gz'):
+        return gzip.GzipFile(fileobj=body)
+    return body
+
+
+def data_name(s3_client, bucket, key):
+    """Name of the file inside an object (itself, less .gz, or the one file in a .zip)."""
+    if key.endswith('.gz'):
+        return key[:-len('.gz')]
+    if key.endswith('.zip'):
+        with zipfile.ZipFile(io.BufferedReader(S3RangeReader(s3_client, bucket, key), RANGE_BUFFER)) as archive:
+            return zip_member(archive).filename
+    return key
+
+
+def data_size(s3_client, bucket, key, size):
+    """Uncompressed bytes of an object's data, given its ContentLength."""
+    if key.endswith('.gz'):
+        # gzip ends with the uncompressed size, modulo 4GB
+        trailer = s3_client.get_object(Bucket=bucket, Key=key, Range='bytes=-4')['Body'].read()
+        return max(int.from_bytes(trailer, 'little'), size)
+    if key.endswith('.zip'):
+        with zipfile.ZipFile(io.BufferedReader(S3RangeReader(s3_client, bucket, key, size), RANGE_BUFFER)) as archive:
+            return zip_member(archive).file_size
+    return size
+
+
+def zip_member(archive):
+    members = [
+        i for i in archive.infolist()
+        if not i.is_dir() and i.filename.lower().endswith(('.csv', '.txt')) and '__MACOSX' not in i.filename
+    ]
+    if len(members) != 1:
+        raise ValueError('Expected one .csv or .txt file in archive, found %d' % len(members))
+    return members[0]
+
+
+def detect_encoding(source, max_bytes=DETECT_BYTES):
+    """Guess the encoding of a binary stream from a bounded prefix.
+
+    Returns the encoding and the bytes consumed, so the caller can replay them.
+    """
+    from chardet.universaldetector import UniversalDetector
+    detector = UniversalDetector()
+    prefix = bytearray()
+    while len(prefix) < max_bytes and not detector.done:
+        block = source.read(min(BLOCK_SIZE, max_bytes - len(prefix)))
+        if not block:
+            break
+        prefix += block
+        detector.feed(block)
+    detector.close()
+    encoding = detector.result['encoding']
+    # A pure ASCII prefix says nothing about the rest of the file, so this is
+    # only a first guess: convert_txt decodes anything that isn't UTF-8 as cp1252
+    if encoding is None or encoding == 'ascii':
+        print('No encoding detected in the first %d bytes, reading as UTF-8 with cp1252 fallback' % len(prefix))
+        encoding = 'utf-8'
+    return encoding, bytes(prefix)
+
+
+def cp1252_fallback(error):
+    """Codec error handler decoding bytes the detected encoding rejects as cp1252.
+
+    Single-byte exports (cp1252/Latin-1) whose first non-ASCII character comes
+    after the detection prefix decode correctly this way. Bytes cp1252 leaves
+    undefined are read as Latin-1.
+    """
+    if not isinstance(error, UnicodeDecodeError):
+        raise error
+    bad = error.object[error.start:error.end]
+    return ''.join(bytes([b]).decode('cp1252', errors='ignore') or chr(b) for b in bad), error.end
+
+
+codecs.register_error('cp1252_fallback', cp1252_fallback)
+
+
+def convert_txt(source, dest):
+    """Convert a tab-delimited binary stream into a UTF-8 CSV binary stream.
+
+    Strips <NUL> characters and leading/trailing spaces from every column.
+    `dest` is left open so the caller decides whether to commit or abort it.
+    """
+    encoding, prefix = detect_encoding(source)
+    in_text = io.TextIOWrapper(
+        io.BufferedReader(ReplayStream(prefix, source), BLOCK_SIZE), encoding=encoding, errors='cp1252_fallback')
+    out_csv = io.TextIOWrapper(dest, encoding='utf-8', newline='')
+    data = (line.replace('\0', '') for line in in_text)
+    in_reader = csv.reader(data, delimiter='\t')
+    out_writer = csv.writer(out_csv)
+    rows = 0
+    while True:
+        batch = [[col.strip() for col in row] for row in islice(in_reader, ROW_BATCH)]
+        if not batch:
+            break
+        out_writer.writerows(batch)
+        rows += len(batch)
+    out_csv.flush()
+    out_csv.detach()
+    return rows
+
+
+def split_csv(source, s3_client, bucket, file_key, chunk_size, columns, validator=None):
+    """Write each upload type's columns of a CSV stream as chunk objects.
+
+    `columns` maps upload types to the header names they send. Rows failing
+    the validator, if any, are left out. Returns the number of rows written
+    and the files, one {upload_type: key} dict per chunk.
+    """
+    reader = csv.reader(open_text(source))
+    header = next(reader, None)
+    if header is None:
+        return 0, []
+    if validator:
+        reader = validator.filter(header, reader)
+    chunks = ChunkWriter(s3_client, bucket, file_key, header, columns, chunk_size)
+    for row in reader:
+        chunks.writerow(row)
+    return chunks.rows, chunks.close()
+
+
+def csv_stats(path):
+    """Rows (excluding the header), columns and bytes of a local CSV."""
+    with open(path, newline='', encoding='utf-8-sig') as file:
+        reader = csv.reader(file)
+        header = next(reader, [])
+        rows = sum(1 for _ in reader)
+    return {
+        "rows": rows,
+        "columns": len(header),
+        "bytes": os.path.getsize(path),
+    }
+
+
+def open_text(source, encoding='utf-8-sig'):
+    """Wrap any object with a read(size) method (e.g. an S3 body) as a CSV-ready text stream."""
+    return io.TextIOWrapper(
+        io.BufferedReader(ReplayStream(b'', source), BLOCK_SIZE), encoding=encoding, newline='')
+
+
+class ChunkWriter:
+    """Buffers CSV rows and writes them to S3 as `<file_key>.<upload_type>.<N>` objects.
+
+    Each upload type's file only has the columns it sends (in `columns` order,
+    skipping any the header lacks). A chunk holds up to chunk_size rows and a
+    row lands in the same chunk for every type it's written for, so memory
+    stays bounded by a single chunk however large the source is.
+    """
+
+    def __init__(self, s3_client, bucket, file_key, header, columns, chunk_size):
+        self.s3_client = s3_client
+        self.bucket = bucket
+        self.file_key = file_key
+        self.header = header
+        self.indexes = {t: [header.index(c) for c in cols if c in header] for t, cols in columns.items()}
+        self.chunk_size = chunk_size
+        self.rows = 0
+        self.files = []
+        self._start_chunk()
+
+    def _start_chunk(self):
+        self._buffers = {}
+        self._writers = {}
+        self._pending = 0
+
+    def writerow(self, row, upload_types=None):
+        """Write a row to the files of upload_types (default all of them)."""
+        for upload_type in upload_types or self.indexes:
+            indexes = self.indexes[upload_type]
+            if upload_type not in self._writers:
+                self._buffers[upload_type] = io.StringIO()
+                self._writers[upload_type] = csv.writer(self._buffers[upload_type])
+                self._writers[upload_type].writerow([self.header[i] for i in indexes])
+            self._writers[upload_type].writerow([row[i] if i < len(row) else '' for i in indexes])
+        self._pending += 1
+        self.rows += 1
+        if self._pending == self.chunk_size:
+            self._flush()
+
+    def _flush(self):
+        chunk = {}
+        for upload_type, buffer in self._buffers.items():
+            chunk[upload_type] = '%s.%s.%d' % (self.file_key, upload_type, len(self.files))
+            self.s3_client.put_object(
+                Bucket=self.bucket, Key=chunk[upload_type], Body=buffer.getvalue().encode('utf-8'))
+        self.files.append(chunk)
+        self._start_chunk()
+
+    def close(self):
+        if self._pending:
+            self._flush()
+        return self.files
+
+
+class ReplayStream(io.RawIOBase):
+    """Readable stream that replays already-consumed bytes before the rest of the source."""
+
+    def __init__(self, prefix, source):
+        self._prefix = memoryview(prefix)
+        self._source = source
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        if len(self._prefix):
+            size = min(len(buffer), len(self._prefix))
+            buffer[:size] = self._prefix[:size]
+            self._prefix = self._prefix[size:]
+            return size
+        data = self._source.read(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
+
+
+class S3RangeReader(io.RawIOBase):
+    """Seekable stream over an S3 object, for formats like zip that read their index first.
+
+    Reads continue one streaming GET until the next seek starts a ranged one,
+    so a sequential read costs a single request.
+    """
+
+    def __init__(self, s3_client, bucket, key, size=None):
+        self.s3_client = s3_client
+        self.bucket = bucket
+        self.key = key
+        if size is None:
+            size = s3_client.head_object(Bucket=bucket, Key=key)['ContentLength']
+        self.size = size
+        self._pos = 0
+        self._body = None
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._pos
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self._pos
+        elif whence == io.SEEK_END:
+            offset += self.size
+        if offset != self._pos and self._body is not None:
+            self._body.close()
+            self._body = None
+        self._pos = offset
+        return self._pos
+
+    def readinto(self, buffer):
+        if self._pos >= self.size:
+            return 0
+        if self._body is None:
+            self._body = self.s3_client.get_object(
+                Bucket=self.bucket, Key=self.key, Range='bytes=%d-' % self._pos)['Body']
+        data = self._body.read(len(buffer))
+        buffer[:len(data)] = data
+        self._pos += len(data)
+        return len(data)
+
+    def close(self):
+        if self._body is not None:
+            self._body.close()
+            self._body = None
+        super().close()
+
+
+class S3Writer(io.RawIOBase):
+    """Writable stream that uploads to S3 in parts as the data comes in.
+
+    Small objects are sent with a single put_object on close. Use it as a
+    context manager so an exception aborts the multipart upload.
+    """
+
+    def __init__(self, s3_client, bucket, key, part_size=PART_SIZE):
+        self.s3_client = s3_client
+        self.bucket = bucket
+        self.key = key
+        self.part_size = part_size
+        self._buffer = bytearray()
+        self._parts = []
+        self._upload_id = None
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._buffer += data
+        if len(self._buffer) >= self.part_size:
+            self._upload_part()
+        return len(data)
+
+    def _upload_part(self):
+        if self._upload_id is None:
+            self._upload_id = self.s3_client.create_multipart_upload(
+                Bucket=self.bucket, Key=self.key)['UploadId']
+        number = len(self._parts) + 1
+        part = self.s3_client.upload_part(
+            Bucket=self.bucket, Key=self.key, UploadId=self._upload_id,
+            PartNumber=number, Body=bytes(self._buffer))
+        self._parts.append({'ETag': part['ETag'], 'PartNumber': number})
+        self._buffer = bytearray()
+
+    def close(self):
+        if self.closed:
+            return
+        if self._upload_id is None:
+            self.s3_client.put_object(Bucket=self.bucket, Key=self.key, Body=bytes(self._buffer))
+        else:
+            if self._buffer:
+                self._upload_part()
+            self.s3_client.complete_multipart_upload(
+                Bucket=self.bucket, Key=self.key, UploadId=self._upload_id,
+                MultipartUpload={'Parts': self._parts})
+        super().close()
+
+    def abort(self):
+        if self.closed:
+            return
+        if self._upload_id is not None:
+            self.s3_client.abort_multipart_upload(
+                Bucket=self.bucket, Key=self.key, UploadId=self._upload_id)
+        self._buffer = bytearray()
+        super().close()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type:
+            self.abort()
+        else:
+            self.close()
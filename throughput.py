@@ -0,0 +1,94 @@
+import math
+import time
+
+HISTORY_SIZE = 50
+MIN_SAMPLES = 3
+CHUNK_SIZES = [1000, 2000, 2500, 5000, 7500, 10000, 15000, 20000]
+
+
+def history_key(instance, campaign_key):
+    return '%s/%s' % (instance, campaign_key)
+
+
+def record_upload(store, key, upload_type, rows, columns, file_bytes, seconds, source_bytes_per_row=None):
+    """Keep the last HISTORY_SIZE finished uploads (start of start_upload to Complete).
+
+    file_bytes is the size of the file sent, which only has this upload type's
+    columns. source_bytes_per_row is the dropped file's, for estimating rows
+    from the size of the next one.
+    """
+    samples = store.get(key) or []
+    samples.append({
+        "upload_type": upload_type,
+        "rows": rows,
+        "columns": columns,
+        "bytes": file_bytes,
+        "source_bytes_per_row": source_bytes_per_row,
+        "seconds": seconds,
+        "finished_at": time.time(),
+    })
+    store.put(key, samples[-HISTORY_SIZE:])
+
+
+def fit(samples):
+    """Least squares fit of seconds = fixed + per_row * rows. Returns (fixed, per_row)."""
+    n = len(samples)
+    mean_rows = sum(s['rows'] for s in samples) / n
+    mean_seconds = sum(s['seconds'] for s in samples) / n
+    spread = sum((s['rows'] - mean_rows) ** 2 for s in samples)
+    if spread == 0:
+        # All samples the same size, so we can't separate fixed cost from per-row cost
+        return 0, mean_seconds / max(mean_rows, 1)
+    per_row = sum((s['rows'] - mean_rows) * (s['seconds'] - mean_seconds) for s in samples) / spread
+    per_row = max(per_row, 0)
+    return max(mean_seconds - per_row * mean_rows, 0), per_row
+
+
+def models(samples, upload_types):
+    """Fitted (fixed, per_row) per upload type, or None without enough history for each of them."""
+    fitted = {}
+    for upload_type in upload_types:
+        typed = [s for s in samples if s['upload_type'] == upload_type]
+        if len(typed) < MIN_SAMPLES:
+            return None
+        fitted[upload_type] = fit(typed)
+    return fitted
+
+
+def predict_seconds(samples, upload_type, rows):
+    """Expected seconds from start_upload to Complete, or None without enough history."""
+    fitted = models(samples or [], [upload_type])
+    if not fitted:
+        return None
+    fixed, per_row = fitted[upload_type]
+    return fixed + per_row * rows
+
+
+def estimate_rows(samples, file_bytes):
+    """Rows in a dropped file of file_bytes, from the row width of earlier dropped files."""
+    # Not the sent files' bytes: those only have one upload type's columns
+    sized = [s for s in samples if s.get('source_bytes_per_row') and s['rows']]
+    if not sized:
+        return None
+    bytes_per_row = sum(s['source_bytes_per_row'] * s['rows'] for s in sized) / sum(s['rows'] for s in sized)
+    return int(file_bytes / bytes_per_row)
+
+
+def choose_chunk_size(samples, file_bytes, upload_types, parallel, default=5000):
+    """Chunk size with the lowest predicted end-to-end time, or default without enough history.
+
+    Chunks run `parallel` at a time and each runs its upload types in order,
+    so a file takes ceil(chunks / parallel) rounds of one chunk's uploads.
+    """
+    fitted = models(samples or [], upload_types)
+    rows = estimate_rows(samples or [], file_bytes) if fitted else None
+    if not rows:
+        return default
+
+    def predicted(chunk_size):
+        chunk_rows = min(chunk_size, rows)
+        rounds = math.ceil(math.ceil(rows / chunk_size) / parallel)
+        return rounds * sum(fixed + per_row * chunk_rows for fixed, per_row in fitted.values())
+
+    # Prefer bigger chunks on ties (fewer executions to babysit)
+    return min(reversed(CHUNK_SIZES), key=predicted)
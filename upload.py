@@ -1,67 +1,107 @@
-import csv
-import json
 import os
 import time
-import chardet
-from selenium import webdriver
+from contextlib import contextmanager
 from selenium.common.exceptions import TimeoutException
 from selenium.common.exceptions import NoSuchElementException
 from selenium.webdriver.support import expected_conditions as EC
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.common.desired_capabilities import DesiredCapabilities
-import yaml
+import metrics
+from browser import captured_request, clear_captured, launch_driver
+from api import ABClient, APIError
+from campaigns import CampaignError, DataError
+from stream import convert_txt
 
 class ABUploader:
 
     STATUS_XPATH = "//app-upload-list-page//div[.//child::a|span[text()='%s']]/../div[6]"
+    LOGIN_OR_HOME = (By.XPATH, '//app-login-box | //app-home')
+    SESSION_TTL = int(os.getenv('SESSION_TTL', 8 * 60 * 60))
+    SESSION_COOKIE_KEYS = ['name', 'value', 'path', 'domain', 'secure', 'httpOnly', 'expiry']
+    # Cells of each row on /admin/upload/list (status is div[6] in STATUS_XPATH)
+    UPLOAD_LIST_CELLS = ['name', 'type', 'campaign', 'rows', 'created', 'status']
+    # How the created cell may be written, most likely first
+    CREATED_FORMATS = ['%Y-%m-%d %H:%M', '%Y-%m-%d %H:%M:%S', '%m/%d/%Y %I:%M %p', '%m/%d/%y, %I:%M %p',
+                       '%b %d, %Y, %I:%M:%S %p', '%b %d, %Y %I:%M %p']
+    UPLOAD_LIST_SCRIPT = """
+return Array.from(document.querySelectorAll('app-upload-list-page div'))
+    .filter(row => row.querySelectorAll(':scope > div').length >= 6 && row.querySelector(':scope > div > a, :scope > div > span'))
+    .map(row => Array.from(row.querySelectorAll(':scope > div'), cell => cell.textContent.trim()).slice(0, 6));"""
+    SNAPSHOT_TTL = int(os.getenv('SNAPSHOT_TTL', 30))
+    # Scripts for map_mode: batch
+    ROW_COLUMNS_SCRIPT = """
+return Array.from(document.querySelectorAll('.mapping--tight'), row => {
+    const input = row.querySelector('input');
+    return input ? input.value : null;
+});"""
+    OPTION_LABELS_SCRIPT = "return Array.from(document.querySelectorAll('mat-option'), o => o.textContent.trim());"
+    OPEN_SELECT_SCRIPT = """
+const row = document.querySelectorAll('.mapping--tight')[arguments[0]];
+const select = row.querySelector(arguments[1]) || document.querySelector(arguments[1]);
+(select.querySelector('.mat-select-trigger') || select).click();
+""" + OPTION_LABELS_SCRIPT
+    SELECT_OPTION_SCRIPT = """
+const option = document.querySelectorAll('mat-option')[arguments[0]];
+if (option.classList.contains('mat-selected')) document.body.click();  // Already selected
+else option.click();"""
 
-    def __init__(self, config, upload_file=None, upload_name=None, chrome_options=None, no_login=False):
-        capabilities = DesiredCapabilities.CHROME.copy()
-        capabilities['goog:loggingPrefs'] = {'performance': 'ALL'}
-        self.driver = webdriver.Chrome(chrome_options=chrome_options, desired_capabilities=capabilities)
+    def __init__(self, config, upload_file=None, upload_name=None, chrome_options=None, no_login=False,
+                 session_store=None, snapshot_store=None, driver_factory=None, checkpoint=None):
+        self.chrome_options = chrome_options
+        # e.g. DriverManager.get, to reuse a browser instead of launching our own
+        self.driver_factory = driver_factory
+        self.no_login = no_login
+        self._driver = None
         self.UPLOAD_FILE = upload_file
         self.UPLOAD_NAME = upload_name
         self.CAMPAIGN_NAME = config['campaign_name']
         self.FIELD_MAP = config['field_map']
-        self.BASE_URL = 'https://%s.actionbuilder.org' % config['instance']
-        if not no_login: self.login()
+        self.INSTANCE = config['instance']
+        self.BASE_URL = config.get('base_url') or 'https://%s.actionbuilder.org' % config['instance']
+        # 'api' reads upload status over GraphQL, only starting Chrome if that fails
+        self.STATUS_BACKEND = config.get('status_backend', 'selenium')
+        # How often wizard waits re-check their condition, in seconds
+        self.POLL_INTERVAL = config.get('poll_interval', 0.2)
+        # 'batch' maps people fields with injected scripts instead of per-element calls
+        self.MAP_MODE = config.get('map_mode', 'element')
+        self._label_index = {}
+        self.timings = {}
+        self.session_store = session_store
+        self.snapshot_store = snapshot_store
+        # Told each stage start_upload gets through, as checkpoint(stage, **fields)
+        self.checkpoint = checkpoint or (lambda stage, **fields: None)
+
+
+    @property
+    def driver(self):
+        # Chrome is only started (and logged in) once something needs it
+        if self._driver is None:
+            if self.driver_factory:
+                self._driver = self.driver_factory()
+            else:
+                with metrics.span('driver_start', start='cold'):
+                    self._driver = launch_driver(self.chrome_options)
+            if not self.no_login:
+                with metrics.span('login'):
+                    self.login()
+        return self._driver
 
 
     def txt_to_csv(txt_file):
         csv_file = txt_file.replace('.txt', '.csv')
-        encoding = chardet.detect(open(txt_file, 'rb').read())['encoding']
-        with open(txt_file, "r", encoding=encoding) as in_text, open(csv_file, "w") as out_csv:
-            # Strip <NUL> characters
-            data = (line.replace('\0', '') for line in in_text)
-            in_reader = csv.reader(data, delimiter='\t')
-            out_writer = csv.writer(out_csv)
-            for row in in_reader:
-                # Strip leading and trailing spaces
-                row = [col.strip() for col in row]
-                out_writer.writerow(row)
+        with open(txt_file, 'rb') as in_text, open(csv_file, 'wb') as out_csv:
+            convert_txt(in_text, out_csv)
         return csv_file
 
 
-    def parse_config(config_path, campaign_key):
-        with open(config_path) as file:
-            config = yaml.load(file, Loader=yaml.FullLoader)
-        if campaign_key not in config:
-            raise CampaignError(
-                'Could not find campaign %s in config file' % campaign_key)
-        return {
-            "instance": config['instance'],
-            "campaign_name": config[campaign_key]['campaign_name'],
-            "field_map": config[campaign_key]['fields']
-        }
-
-
     def login(self):
         driver = self.driver
+        if self.restore_session():
+            print("Restored saved session")
+            return
         driver.get(self.BASE_URL + '/login')
-        LOGIN_OR_HOME = (By.XPATH, '//app-login-box | //app-home')
         el = WebDriverWait(driver, 20).until(
-            EC.presence_of_element_located(LOGIN_OR_HOME))
+            EC.presence_of_element_located(self.LOGIN_OR_HOME))
         if el.tag_name == 'app-home':
             print("Already logged in")
             return
@@ -70,139 +110,228 @@ class ABUploader:
         driver.find_element_by_id('loginButton').click()
         WebDriverWait(driver, 20).until_not(EC.title_contains("Login"))
         print("Logged in succesfully")
+        self.save_session()
+
+
+    def restore_session(self):
+        if not self.session_store:
+            return False
+        session = self.session_store.get(self.INSTANCE)
+        if not session:
+            return False
+        driver = self.driver
+        # Cookies and local storage can only be set once we're on the app's origin
+        driver.get(self.BASE_URL + '/favicon.ico')
+        for cookie in session['cookies']:
+            driver.add_cookie({k: v for k, v in cookie.items() if k in self.SESSION_COOKIE_KEYS})
+        driver.execute_script(
+            "for (const [k, v] of Object.entries(arguments[0])) window.localStorage.setItem(k, v);",
+            session['local_storage'])
+        driver.get(self.BASE_URL + '/')
+        el = WebDriverWait(driver, 20).until(
+            EC.presence_of_element_located(self.LOGIN_OR_HOME))
+        if el.tag_name == 'app-home':
+            return True
+        # Session was rejected, so forget it and do the full login
+        print("Saved session rejected")
+        self.session_store.delete(self.INSTANCE)
+        driver.delete_all_cookies()
+        return False
+
+
+    def save_session(self):
+        if not self.session_store:
+            return
+        driver = self.driver
+        self.session_store.put(self.INSTANCE, {
+            "cookies": driver.get_cookies(),
+            "local_storage": driver.execute_script("return Object.assign({}, window.localStorage);"),
+        }, ttl=self.SESSION_TTL)
 
 
     def start_upload(self, upload_type):
         driver = self.driver
-        if 'people' in upload_type:
-            driver.get(self.BASE_URL + '/admin/upload/entities/mapping')
-        if 'info' in upload_type:
-            driver.get(self.BASE_URL + '/admin/upload/fields')
-        print("Starting %s upload: %s" % (upload_type, self.CAMPAIGN_NAME))
-        WebDriverWait(driver, 20).until(EC.title_contains("Upload"))
-        # Upload file
-        driver.find_element_by_css_selector('input[type="file"]').send_keys(self.UPLOAD_FILE)
-        # Select campaign
-        campaign_select = driver.find_element(By.CSS_SELECTOR, ".mapping app-campaign-select2")
-        campaign_select.click()
-        campaign_select.find_element(By.TAG_NAME, "input").send_keys(self.CAMPAIGN_NAME[:5])
-        time.sleep(1)
-        campaign = next((i for i in campaign_select.find_elements(By.TAG_NAME, "app-list-item") if i.text == self.CAMPAIGN_NAME), None)
-        if campaign is None:
-            raise CampaignError('Campaign %s not found' % self.CAMPAIGN_NAME)
-        campaign.click()
+        self.timings = {}
+        with self.timed('open wizard'):
+            if 'people' in upload_type:
+                driver.get(self.BASE_URL + '/admin/upload/entities/mapping')
+            if 'info' in upload_type:
+                driver.get(self.BASE_URL + '/admin/upload/fields')
+            print("Starting %s upload: %s" % (upload_type, self.CAMPAIGN_NAME))
+            self.wait(20).until(EC.title_contains("Upload"))
+            # Don't pick up the name of an earlier upload from this tab
+            clear_captured(driver, 'CreateUploadMutation')
+        with self.timed('send file'):
+            driver.find_element_by_css_selector('input[type="file"]').send_keys(self.UPLOAD_FILE)
+        self.checkpoint('file sent')
+        with self.timed('select campaign'):
+            campaign_select = driver.find_element(By.CSS_SELECTOR, ".mapping app-campaign-select2")
+            campaign_select.click()
+            campaign_select.find_element(By.TAG_NAME, "input").send_keys(self.CAMPAIGN_NAME[:5])
+            def find_campaign(driver):
+                return next((i for i in campaign_select.find_elements(By.TAG_NAME, "app-list-item") if i.text == self.CAMPAIGN_NAME), False)
+            try:
+                campaign = self.wait(5).until(find_campaign)
+            except TimeoutException:
+                raise CampaignError('Campaign %s not found' % self.CAMPAIGN_NAME)
+            campaign.click()
+            self.wait(5).until(EC.invisibility_of_element_located((By.TAG_NAME, 'app-list-item')))
         # Select People entity type
-        time.sleep(1)
-        entity_select = WebDriverWait(driver, 10).until(EC.element_to_be_clickable((By.XPATH, "//mat-select[@placeholder='Entity Type']")))
-        entity_select.send_keys('People')
-
-        ID_SOURCE = (By.XPATH, "//mat-select[@placeholder='Id to use for matching']")
-        ID_DEST = (By.XPATH, "//mat-select[@placeholder='Upload Column'][@aria-disabled='false']")
-        FIELD_ROWS = (By.CLASS_NAME, 'mapping--tight')
-        WebDriverWait(driver, 5).until(EC.element_to_be_clickable(ID_SOURCE))
-        driver.find_element(*ID_SOURCE).send_keys(self.FIELD_MAP['id']['ab_type'])
-        WebDriverWait(driver, 5).until(EC.presence_of_element_located(ID_DEST))
-        driver.find_element(*ID_DEST).send_keys(self.FIELD_MAP['id']['column'])
-        time.sleep(1)
-        fields = driver.find_elements(*FIELD_ROWS)
+        with self.timed('match ids'):
+            entity_select = self.wait(10).until(EC.element_to_be_clickable((By.XPATH, "//mat-select[@placeholder='Entity Type']")))
+            entity_select.send_keys('People')
+
+            ID_SOURCE = (By.XPATH, "//mat-select[@placeholder='Id to use for matching']")
+            ID_DEST = (By.XPATH, "//mat-select[@placeholder='Upload Column'][@aria-disabled='false']")
+            FIELD_ROWS = (By.CLASS_NAME, 'mapping--tight')
+            self.wait(5).until(EC.element_to_be_clickable(ID_SOURCE))
+            driver.find_element(*ID_SOURCE).send_keys(self.FIELD_MAP['id']['ab_type'])
+            self.wait(5).until(EC.presence_of_element_located(ID_DEST))
+            driver.find_element(*ID_DEST).send_keys(self.FIELD_MAP['id']['column'])
+            self.wait(5).until(EC.text_to_be_present_in_element(ID_DEST, self.FIELD_MAP['id']['column']))
+            fields = self.wait(5).until(EC.presence_of_all_elements_located(FIELD_ROWS))
         # Map Fields
         print("Mapping %s fields: %s" % (upload_type, self.CAMPAIGN_NAME))
         if 'people' in upload_type:
-            for field in fields:
-                column = field.find_element(By.TAG_NAME, 'input').get_attribute('value')
-                map_to = self.FIELD_MAP[upload_type].get(column)
-                if map_to:
-                    element = field.find_element(By.TAG_NAME, 'mat-select')
-                    self.do_column_map(element, column, map_to)
-                    if map_to == 'Email':
-                        type_element = field.find_element(By.XPATH, "//mat-select[@placeholder='Email Type']")
-                        type_value = self.FIELD_MAP[upload_type].get('email_type')
-                        self.do_column_map(type_element, 'Email Type',type_value)
-                    if map_to == 'Phone Number':
-                        type_element = field.find_element(By.XPATH, "//mat-select[@placeholder='Phone Type']")
-                        type_value = self.FIELD_MAP[upload_type].get('phone_type')
-                        self.do_column_map(type_element, 'Phone Type', type_value)
-            time.sleep(3)
-            validation_errors = [e.text for e in driver.find_elements(By.CLASS_NAME, 'error')]
-            if validation_errors:
-                raise DataError('\n'.join(validation_errors))
-            driver.find_element(By.XPATH, "//button[contains(text(), 'Review & Confirm')]").click()
-            WebDriverWait(driver, 30).until(EC.presence_of_element_located((By.XPATH, '//h3[contains(text(), "Review & Process Upload")]')))
-            print('---Fields mapped for %s: %s---' % (upload_type, self.CAMPAIGN_NAME))
-            for checkbox in driver.find_elements(By.XPATH, '//mat-checkbox//label'):
-                checkbox.click()
-            button = WebDriverWait(driver, 10).until(EC.element_to_be_clickable((By.XPATH, '//button[contains(text(),"Process Upload")]')))
-            button.click()
-            try:
-                WebDriverWait(driver, 30).until(EC.title_contains('View Uploads'))
-            except TimeoutException:
-                self.test('upload-timeout.png')
-                raise
-            print('---Upload confirmed for %s: %s---' % (upload_type, self.CAMPAIGN_NAME))
+            with self.timed('map fields'):
+                if self.MAP_MODE == 'batch':
+                    self.batch_map_people_fields(upload_type)
+                else:
+                    self.map_people_fields(upload_type, fields)
+            with self.timed('validate'):
+                REVIEW_BUTTON = (By.XPATH, "//button[contains(text(), 'Review & Confirm')]")
+                # Settled once no async validator is pending and we either have errors or can move on
+                self.wait(30).until(lambda d: not d.find_elements(By.CLASS_NAME, 'ng-pending') and (
+                    d.find_elements(By.CLASS_NAME, 'error') or EC.element_to_be_clickable(REVIEW_BUTTON)(d)))
+                validation_errors = [e.text for e in driver.find_elements(By.CLASS_NAME, 'error')]
+                if validation_errors:
+                    raise DataError('\n'.join(validation_errors))
+            self.checkpoint('mapped')
+            with self.timed('confirm upload'):
+                driver.find_element(*REVIEW_BUTTON).click()
+                self.wait(30).until(EC.presence_of_element_located((By.XPATH, '//h3[contains(text(), "Review & Process Upload")]')))
+                print('---Fields mapped for %s: %s---' % (upload_type, self.CAMPAIGN_NAME))
+                for checkbox in driver.find_elements(By.XPATH, '//mat-checkbox//label'):
+                    checkbox.click()
+                button = self.wait(10).until(EC.element_to_be_clickable((By.XPATH, '//button[contains(text(),"Process Upload")]')))
+                button.click()
+                try:
+                    self.wait(30).until(EC.title_contains('View Uploads'))
+                except TimeoutException:
+                    self.test('upload-timeout.png')
+                    raise
+                print('---Upload confirmed for %s: %s---' % (upload_type, self.CAMPAIGN_NAME))
 
         if 'info' in upload_type:
-            for field in fields:
-                column = field.find_element(By.TAG_NAME, 'input').get_attribute('value')
-                if column in self.FIELD_MAP[upload_type]:
-                    field_info = self.FIELD_MAP[upload_type][column]
-                    element = field.find_element(By.TAG_NAME, 'app-upload-field-selector')
-                    self.do_info_map(element, column, field_info)
-                    time.sleep(1)
-                    if field_info['type'] == 'notes':
-                        note_element = driver.find_element(By.XPATH, '//mat-dialog-container//mat-select')
-                        self.do_column_map(note_element, column + '_note', field_info.get('note_col'))
-                        driver.find_element(By.XPATH, "//mat-dialog-container//button[text()='Apply Field Mapping']").click()
-                        time.sleep(1)
-                    if field_info['type'] == 'address':
-                        elements = driver.find_elements(By.XPATH, '//mat-dialog-container//mat-select')
-                        self.do_column_map(elements[0], column + '_street', field_info.get('street_col'))
-                        self.do_column_map(elements[1], column + '_city',field_info.get('city_col'))
-                        self.do_column_map(elements[2], column + '_state',field_info.get('state_col'))
-                        self.do_column_map(elements[3], column + '_zip',field_info.get('zip_col'))
-                        self.do_column_map(elements[4], column + '_lat',field_info.get('lat_col'))
-                        self.do_column_map(elements[5], column + '_lon',field_info.get('lon_col'))
-                        driver.find_element(By.XPATH, "//mat-dialog-container//button[text()='Apply Field Mapping']").click()
-                        time.sleep(1)
+            with self.timed('map fields'):
+                for field in fields:
+                    column = field.find_element(By.TAG_NAME, 'input').get_attribute('value')
+                    if column in self.FIELD_MAP[upload_type]:
+                        field_info = self.FIELD_MAP[upload_type][column]
+                        element = field.find_element(By.TAG_NAME, 'app-upload-field-selector')
+                        mapped = self.do_info_map(element, column, field_info)
+                        if mapped and field_info['type'] == 'notes':
+                            dialog, selects = self.wait_for_dialog(1)
+                            self.do_column_map(selects[0], column + '_note', field_info.get('note_col'))
+                            self.apply_dialog(dialog)
+                        if mapped and field_info['type'] == 'address':
+                            dialog, elements = self.wait_for_dialog(6)
+                            self.do_column_map(elements[0], column + '_street', field_info.get('street_col'))
+                            self.do_column_map(elements[1], column + '_city',field_info.get('city_col'))
+                            self.do_column_map(elements[2], column + '_state',field_info.get('state_col'))
+                            self.do_column_map(elements[3], column + '_zip',field_info.get('zip_col'))
+                            self.do_column_map(elements[4], column + '_lat',field_info.get('lat_col'))
+                            self.do_column_map(elements[5], column + '_lon',field_info.get('lon_col'))
+                            self.apply_dialog(dialog)
             print('---Fields mapped for %s: %s---' % (upload_type, self.CAMPAIGN_NAME))
-            driver.find_element(By.XPATH, '//button[contains(text(),"Next Step")]').click()
-            WebDriverWait(driver, 10).until(EC.title_contains('Map to responses'))
-            WebDriverWait(driver, 20).until(EC.presence_of_element_located((By.TAG_NAME, 'app-upload-tag-category-map')))
-            print('---Responses mapped for %s: %s---' % (upload_type, self.CAMPAIGN_NAME))
-            driver.find_element(By.XPATH, '//button[contains(text(),"Next Step")]').click()
-            WebDriverWait(driver, 10).until(EC.title_contains('Create Responses'))
-            CONF_LOCATOR = (By.XPATH, '//app-upload-fields-step3-page//button')
-            if driver.find_element(*CONF_LOCATOR).text == 'Create Responses':
-                print('Creating tags: %s' % self.CAMPAIGN_NAME)
+            self.checkpoint('mapped')
+            with self.timed('map responses'):
+                driver.find_element(By.XPATH, '//button[contains(text(),"Next Step")]').click()
+                self.wait(10).until(EC.title_contains('Map to responses'))
+                self.wait(20).until(EC.presence_of_element_located((By.TAG_NAME, 'app-upload-tag-category-map')))
+                print('---Responses mapped for %s: %s---' % (upload_type, self.CAMPAIGN_NAME))
+                driver.find_element(By.XPATH, '//button[contains(text(),"Next Step")]').click()
+                self.wait(10).until(EC.title_contains('Create Responses'))
+            with self.timed('create responses'):
+                CONF_LOCATOR = (By.XPATH, '//app-upload-fields-step3-page//button')
+                if driver.find_element(*CONF_LOCATOR).text == 'Create Responses':
+                    print('Creating tags: %s' % self.CAMPAIGN_NAME)
+                    checkboxes = driver.find_elements(By.XPATH, '//app-upload-fields-step3-page//mat-checkbox//label')
+                    for checkbox in checkboxes:
+                        checkbox.click()
+                    self.wait(30).until(EC.element_to_be_clickable(CONF_LOCATOR))
+                    driver.find_element(*CONF_LOCATOR).click()
+                    self.wait(300).until(EC.presence_of_element_located((By.XPATH, '//span[text()="Response Creation Results"]')))
                 checkboxes = driver.find_elements(By.XPATH, '//app-upload-fields-step3-page//mat-checkbox//label')
                 for checkbox in checkboxes:
                     checkbox.click()
-                WebDriverWait(driver, 30).until(EC.element_to_be_clickable(CONF_LOCATOR))
+                self.wait(30).until(EC.element_to_be_clickable(CONF_LOCATOR))
                 driver.find_element(*CONF_LOCATOR).click()
-                WebDriverWait(driver, 300).until(EC.presence_of_element_located((By.XPATH, '//span[text()="Response Creation Results"]')))
-            checkboxes = driver.find_elements(By.XPATH, '//app-upload-fields-step3-page//mat-checkbox//label')
-            for checkbox in checkboxes:
-                checkbox.click()
-            WebDriverWait(driver, 30).until(EC.element_to_be_clickable(CONF_LOCATOR))
-            driver.find_element(*CONF_LOCATOR).click()
-            WebDriverWait(driver, 10).until(EC.title_contains('View Uploads'))
-            print('---Responses created for %s: %s---' % (upload_type, self.CAMPAIGN_NAME))
-
-        # Return AB's generated upload nmae
-        logs = driver.get_log('performance')
-        for entry in reversed(logs):
-            for k,v in entry.items():
-                if k == 'message' and 'CreateUploadMutation' in v:
-                    msg = json.loads(v)['message']
-                    self.UPLOAD_NAME = json.loads(msg['params']['request']['postData'])['variables']['input']['name']
-                    return self.UPLOAD_NAME
+                self.wait(10).until(EC.title_contains('View Uploads'))
+                print('---Responses created for %s: %s---' % (upload_type, self.CAMPAIGN_NAME))
+
+        self.timing_report(upload_type)
+        # Return AB's generated upload name, from the request the wizard just sent
+        request = captured_request(driver, 'CreateUploadMutation')
+        if request:
+            self.UPLOAD_NAME = request['variables']['input']['name']
+            self.checkpoint('submitted', upload_name=self.UPLOAD_NAME)
+            return self.UPLOAD_NAME
 
         # If not found, something went wrong
         raise UploadError("Upload failed to start for %s: %s" % (upload_type, self.CAMPAIGN_NAME))
 
+    def map_people_fields(self, upload_type, fields):
+        for field in fields:
+            column = field.find_element(By.TAG_NAME, 'input').get_attribute('value')
+            map_to = self.FIELD_MAP[upload_type].get(column)
+            if map_to:
+                element = field.find_element(By.TAG_NAME, 'mat-select')
+                self.do_column_map(element, column, map_to)
+                if map_to == 'Email':
+                    type_element = field.find_element(By.XPATH, "//mat-select[@placeholder='Email Type']")
+                    type_value = self.FIELD_MAP[upload_type].get('email_type')
+                    self.do_column_map(type_element, 'Email Type',type_value)
+                if map_to == 'Phone Number':
+                    type_element = field.find_element(By.XPATH, "//mat-select[@placeholder='Phone Type']")
+                    type_value = self.FIELD_MAP[upload_type].get('phone_type')
+                    self.do_column_map(type_element, 'Phone Type', type_value)
+
+    def batch_map_people_fields(self, upload_type):
+        """Same mapping as map_people_fields, with a few scripted round trips per column.
+
+        Column names come back in one call and option labels come back with the
+        click that opens each dropdown, so only the needed clicks are sent.
+        """
+        field_map = self.FIELD_MAP[upload_type]
+        columns = self.driver.execute_script(self.ROW_COLUMNS_SCRIPT)
+        for row, column in enumerate(columns):
+            map_to = field_map.get(column)
+            if not map_to:
+                continue
+            self.batch_select(row, 'mat-select', column, map_to)
+            if map_to == 'Email':
+                self.batch_select(row, "mat-select[placeholder='Email Type']", 'Email Type', field_map.get('email_type'))
+            if map_to == 'Phone Number':
+                self.batch_select(row, "mat-select[placeholder='Phone Type']", 'Phone Type', field_map.get('phone_type'))
+
+    def batch_select(self, row, selector, column, value):
+        driver = self.driver
+        labels = driver.execute_script(self.OPEN_SELECT_SCRIPT, row, selector)
+        if not labels:
+            labels = self.wait(10).until(lambda d: d.execute_script(self.OPTION_LABELS_SCRIPT))
+        index = self._label_index.get(tuple(labels))
+        if index is None:
+            index = self._label_index[tuple(labels)] = {label: i for i, label in enumerate(labels)}
+        # If no match found, select blank option
+        driver.execute_script(self.SELECT_OPTION_SCRIPT, index.get(value, 0))
+        if value in index:
+            print('Mapped %s to %s' % (column, value))
+        self.wait(10).until(lambda d: not d.execute_script(self.OPTION_LABELS_SCRIPT))
+
     def do_column_map(self, element, column, value):
         element.click()
-        time.sleep(1)
-        options = element.find_elements(By.XPATH, '//mat-option')
+        options = self.wait(10).until(EC.presence_of_all_elements_located((By.XPATH, '//mat-option')))
         for option in options:
             if option.text == value:
                 if 'mat-selected' in option.get_attribute('class'):
@@ -211,32 +340,149 @@ class ABUploader:
                 else:
                     option.click()
                 print('Mapped %s to %s' % (column, value))
-                return
-        # If no match found, select blank option
-        options[0].click()
+                break
+        else:
+            # If no match found, select blank option
+            options[0].click()
+        self.wait(10).until(EC.invisibility_of_element_located((By.XPATH, '//mat-option')))
 
     def do_info_map(self, element, column, field_info):
         element.click()
-        time.sleep(1)
+        LIST_OPTIONS = (By.CSS_SELECTOR, 'mat-list-option, mat-subheader')
+        self.wait(10).until(EC.presence_of_all_elements_located(LIST_OPTIONS))
         section_found = False if field_info.get('section') else True
-        for option in self.driver.find_elements(By.CSS_SELECTOR, 'mat-list-option, mat-subheader'):
+        for option in self.driver.find_elements(*LIST_OPTIONS):
             if not section_found and option.text == field_info.get('section').upper():
                 section_found = True
             if option.text == field_info['name'] and section_found:
                 option.click()
                 print('Mapped %s to %s' % (column, field_info['name']))
-                return
+                self.wait(10).until(EC.invisibility_of_element_located((By.TAG_NAME, 'mat-list-option')))
+                return True
         # If no match found, clear the dialog
         self.driver.find_element(By.TAG_NAME, 'body').click()
+        self.wait(10).until(EC.invisibility_of_element_located((By.TAG_NAME, 'mat-list-option')))
+        return False
+
+    def wait_for_dialog(self, selects):
+        """Wait for a notes/address dialog to render its column dropdowns."""
+        SELECTS = (By.XPATH, '//mat-dialog-container//mat-select')
+        elements = self.wait(10).until(lambda d: len(d.find_elements(*SELECTS)) >= selects and d.find_elements(*SELECTS))
+        return self.driver.find_element(By.TAG_NAME, 'mat-dialog-container'), elements
+
+    def apply_dialog(self, dialog):
+        dialog.find_element(By.XPATH, ".//button[text()='Apply Field Mapping']").click()
+        self.wait(10).until(EC.staleness_of(dialog))
+
+    def wait(self, timeout):
+        return WebDriverWait(self.driver, timeout, poll_frequency=self.POLL_INTERVAL)
+
+    @contextmanager
+    def timed(self, step):
+        start = time.perf_counter()
+        try:
+            with metrics.span('wizard.%s' % step.replace(' ', '_')):
+                yield
+        finally:
+            self.timings[step] = self.timings.get(step, 0) + time.perf_counter() - start
+
+    def timing_report(self, upload_type):
+        total = sum(self.timings.values())
+        print('Wizard timings for %s (%.1fs): %s' % (upload_type, total, ', '.join(
+            '%s %.1fs' % (step, seconds) for step, seconds in self.timings.items())))
 
 
     def get_upload_status(self):
-        driver=self.driver
+        with metrics.span('status_check') as span:
+            if self.STATUS_BACKEND == 'api':
+                try:
+                    span['source'] = 'api'
+                    status = self.get_api_status()
+                    print("Upload is %s — %s" % (status, self.CAMPAIGN_NAME))
+                    return status
+                except APIError as e:
+                    print("API status check failed, falling back to browser: %s" % e)
+            snapshot = self.snapshot_store.get(self.INSTANCE) if self.snapshot_store else None
+            if snapshot and self.UPLOAD_NAME in snapshot['uploads']:
+                span['source'] = 'snapshot'
+                status = snapshot['uploads'][self.UPLOAD_NAME]['status']
+            else:
+                span['source'] = 'browser'
+                uploads = self.get_upload_list()
+                if self.UPLOAD_NAME in uploads:
+                    status = uploads[self.UPLOAD_NAME]['status']
+                else:
+                    # UPLOAD_LIST_SCRIPT missed the row STATUS_XPATH found, so read its status cell directly
+                    print('Upload %s missing from parsed upload list, reading its status cell' % self.UPLOAD_NAME)
+                    status = self.driver.find_element(By.XPATH, self.STATUS_XPATH % self.UPLOAD_NAME).text.strip()
+            print("Upload is %s — %s" % (status, self.CAMPAIGN_NAME))
+            return status
+
+
+    def get_upload_list(self):
+        """Parse every upload on /admin/upload/list and share it through the snapshot store."""
+        driver = self.driver
         driver.get(self.BASE_URL + '/admin/upload/list')
-        status = WebDriverWait(driver, 20).until(EC.presence_of_element_located(
-            (By.XPATH, self.STATUS_XPATH % self.UPLOAD_NAME)))
-        print("Upload is %s — %s" % (status.text, self.CAMPAIGN_NAME))
-        return status.text
+        if self.UPLOAD_NAME:
+            # A new upload can take a moment to show up in the list
+            WebDriverWait(driver, 20).until(EC.presence_of_element_located(
+                (By.XPATH, self.STATUS_XPATH % self.UPLOAD_NAME)))
+        else:
+            WebDriverWait(driver, 20).until(EC.presence_of_element_located((By.TAG_NAME, 'app-upload-list-page')))
+        uploads = {}
+        for cells in driver.execute_script(self.UPLOAD_LIST_SCRIPT):
+            upload = dict(zip(self.UPLOAD_LIST_CELLS, cells))
+            rows = upload['rows'].replace(',', '')
+            upload['rows'] = int(rows) if rows.isdigit() else None
+            uploads[upload['name']] = upload
+        if self.snapshot_store:
+            self.snapshot_store.put(self.INSTANCE, {
+                "taken_at": time.time(),
+                "uploads": uploads,
+            }, ttl=self.SNAPSHOT_TTL)
+        return uploads
+
+
+    def find_upload(self, file_name, upload_name=None, since=None):
+        """Name of an upload already submitted for this file since `since`, or None.
+
+        Uploads are named after the file the wizard was given, then a space,
+        and every chunk and upload type sends its own file, so the name
+        identifies them. Files dropped again under the same key get the same
+        name, so only uploads created since this attempt started count.
+        """
+        uploads = self.get_upload_list()
+        if upload_name in uploads:
+            return upload_name
+        # The created cell only has minutes
+        since = since - since % 60 if since else None
+        for name, upload in uploads.items():
+            if name != file_name and not name.startswith(file_name + ' '):
+                continue
+            if upload['campaign'] != self.CAMPAIGN_NAME:
+                continue
+            created = ABUploader.created_at(upload['created'])
+            if since and (created is None or created < since):
+                continue
+            return name
+        return None
+
+
+    def created_at(text):
+        """Epoch seconds of an upload list created cell, or None if it isn't in a known format."""
+        for created_format in ABUploader.CREATED_FORMATS:
+            try:
+                return time.mktime(time.strptime(text, created_format))
+            except ValueError:
+                pass
+        return None
+
+
+    def get_api_status(self):
+        session = self.session_store.get(self.INSTANCE) if self.session_store else None
+        if not session:
+            raise APIError('No saved session for %s' % self.INSTANCE)
+        return ABClient(self.BASE_URL, session).get_upload_status(self.UPLOAD_NAME)
 
 
     def finish_upload(self):
@@ -261,7 +507,9 @@ class ABUploader:
 
 
     def quit(self):
-        self.driver.quit()
+        # A shared driver belongs to whoever handed it to us
+        if self._driver is not None and not self.driver_factory:
+            self._driver.quit()
 
 
     def test(self, screenshot_name=None):
@@ -277,11 +525,5 @@ class ABUploader:
                 s3_client.upload_file(screenshot_path, os.getenv('S3_UPLOAD_BUCKET'), screenshot_name)
 
 
-class DataError(Exception):
-    pass
-
-class CampaignError(Exception):
-    pass
-
 class UploadError(Exception):
     pass
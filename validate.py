@@ -0,0 +1,131 @@
+import csv
+import io
+import re
+from itertools import islice
+from stream import ROW_BATCH
+from campaigns import DataError, upload_columns
+
+# Empty values always pass, since Action Builder just leaves those fields blank
+FORMATS = {
+    "email": re.compile(r'[^@\s]+@[^@\s]+\.[^@\s.]+'),
+    # 10 to 15 digits, with the usual separators
+    "phone": re.compile(r'(?=(?:\D*\d){10,15}\D*$)\+?[\d\s().-]+'),
+    "zip": re.compile(r'\d{5}(-?\d{4})?|[A-Za-z]\d[A-Za-z] ?\d[A-Za-z]\d'),
+}
+PEOPLE_FORMATS = {'Email': 'email', 'Phone Number': 'phone', 'Zip/Postal Code': 'zip'}
+# How many errors make it into the rejection message (the report has all of them)
+SAMPLE_ERRORS = 10
+
+
+def format_columns(field_map, upload_types):
+    """{column: format} for mapped columns that have a format to check."""
+    formats = {}
+    for upload_type in upload_types:
+        for column, field in field_map[upload_type].items():
+            if 'people' in upload_type:
+                if field in PEOPLE_FORMATS:
+                    formats[column] = PEOPLE_FORMATS[field]
+            elif field.get('zip_col'):
+                formats[field['zip_col']] = 'zip'
+    return formats
+
+
+def sub_columns(field_map, upload_types):
+    """Info fields' extra columns (note_col, street_col, ...), which files may leave out."""
+    return {v for t in upload_types if 'people' not in t
+            for field in field_map[t].values() for k, v in field.items() if k.endswith('_col') and v}
+
+
+def column(block, i):
+    return [row[i] if i < len(row) else '' for row in block]
+
+
+class Validator:
+    """Checks a CSV before anything reaches Action Builder.
+
+    The header must have the id column and every column the config maps,
+    though info fields' sub-columns may be missing (they're left blank). Rows are checked a
+    block at a time, one column at a time: ids must be present and unique,
+    and email, phone and zip columns must look right. Failing rows are left
+    out of filter()'s output and listed in an error report. With
+    mode: quarantine they're also copied, unchanged, to a quarantine file.
+    `open_report(name)` returns a writable binary stream for each of those.
+    `columns` is the campaign's compiled {upload type: columns}, if at hand.
+    """
+
+    REPORT_HEADER = ['row', 'id', 'column', 'value', 'error']
+
+    def __init__(self, field_map, upload_types, mode='reject', open_report=None, columns=None):
+        self.id_column = field_map['id']['column']
+        columns = columns or {t: upload_columns(field_map, t) for t in upload_types}
+        optional = sub_columns(field_map, upload_types)
+        self.required = list(dict.fromkeys(c for t in upload_types for c in columns[t] if c not in optional))
+        self.formats = format_columns(field_map, upload_types)
+        self.mode = mode
+        self.open_report = open_report
+        self.bad_rows = 0
+        self.samples = []
+        self._reports = {}
+        self._writers = {}
+
+    def check_header(self, header):
+        missing = [c for c in self.required if c not in header]
+        if missing:
+            raise DataError('Columns missing from file: %s' % ', '.join(missing))
+
+    def filter(self, header, rows):
+        """Yield the rows that pass every check."""
+        self.check_header(header)
+        self.header = header
+        id_index = header.index(self.id_column)
+        checks = [(c, header.index(c), FORMATS[kind], kind) for c, kind in self.formats.items() if c in header]
+        seen = set()
+        line = 1
+        while True:
+            block = list(islice(rows, ROW_BATCH))
+            if not block:
+                break
+            errors = [[] for _ in block]
+            ids = column(block, id_index)
+            for n, row_id in enumerate(ids):
+                if not row_id:
+                    errors[n].append((self.id_column, row_id, 'missing id'))
+                elif row_id in seen:
+                    errors[n].append((self.id_column, row_id, 'duplicate id'))
+                else:
+                    seen.add(row_id)
+            for name, i, pattern, kind in checks:
+                for n, value in enumerate(column(block, i)):
+                    if value and not pattern.fullmatch(value):
+                        errors[n].append((name, value, 'invalid %s' % kind))
+            for n, row in enumerate(block):
+                if errors[n]:
+                    self.record(line + n + 1, ids[n], row, errors[n])
+                else:
+                    yield row
+            line += len(block)
+
+    def record(self, line, row_id, row, errors):
+        self.bad_rows += 1
+        for name, value, error in errors:
+            self.write('errors', [line, row_id, name, value, error], self.REPORT_HEADER)
+            if len(self.samples) < SAMPLE_ERRORS:
+                self.samples.append('Row %d: %s in %s (%s)' % (line, error, name, value))
+        if self.mode == 'quarantine':
+            self.write('quarantine', row, self.header)
+
+    def write(self, name, row, header):
+        if not self.open_report:
+            return
+        if name not in self._writers:
+            self._reports[name] = io.TextIOWrapper(self.open_report(name), encoding='utf-8', newline='')
+            self._writers[name] = csv.writer(self._reports[name])
+            self._writers[name].writerow(header)
+        self._writers[name].writerow(row)
+
+    def close(self):
+        for report in self._reports.values():
+            report.close()
+
+    def summary(self):
+        return '%d rows failed validation\n%s' % (self.bad_rows, '\n'.join(self.samples))